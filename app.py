@@ -1,25 +1,30 @@
+import time
+
+# 再実行ごとの準備時間は、import も含めてスクリプトの先頭から測る
+RERUN_STARTED = time.perf_counter()
+
 import streamlit as st
 import sys
-from PIL import Image
 import io
-import openai
-import time
-import csv
-import re
+import itertools
 
 
 
-from streamlit_oauth import OAuth2Component
-from streamlit_cookies_manager import CookieManager
 import datetime
-from google import genai
-from google.genai import types
-import requests
 import base64
 import json
 import mimetypes
 import os
 
+from cache import ContentCache
+from ingest import HEADING_KEYWORDS_LABEL, MAIN_KEYWORD_LABEL, ArticleCsvReader, decode_stream, parse_keyword_cell
+from jobs import job_runner_from_secrets
+from metrics import pricing_from_secrets, records_to_csv, records_to_json, summarize_articles, summarize_calls
+from pipeline import STATUS_LABELS, Settings, runner_factory_from_secrets
+from wordpress import WordPressClient
+
+IMPORTS_FINISHED = time.perf_counter()
+
 st.set_page_config(
     page_title="WordPress Article Generator",
     page_icon="🤖",
@@ -28,24 +33,173 @@ st.set_page_config(
 
 st.title("WordPress Article Generator 🤖")
 
-# --- Configuration ---
-CLIENT_ID = st.secrets.get("google_oauth", {}).get("client_id")
-CLIENT_SECRET = st.secrets.get("google_oauth", {}).get("client_secret")
-REDIRECT_URI = st.secrets.get("google_oauth", {}).get("redirect_uri")
-TARGET_EMAIL = st.secrets.get("authentication", {}).get("target_user_email")
 AUTHORIZE_ENDPOINT = "https://accounts.google.com/o/oauth2/v2/auth"
 TOKEN_ENDPOINT = "https://oauth2.googleapis.com/token"
 
+JOB_STATUS_LABELS = {"queued": "待機中", "running": "実行中", "done": "完了", "failed": "失敗"}
+# 行数がこれを超えるジョブでは、進捗表に処理中の行だけを出す
+PROGRESS_TABLE_LIMIT = 50
+EVENT_LOG_LIMIT = 300
+# 準備時間の履歴としてセッションに残す再実行の数
+SETUP_HISTORY_LIMIT = 20
+
+
+class SetupTimer:
+    """再実行ごとの準備処理（import・認証・設定の読み込みなど）にかかった時間を記録する。
+
+    ``placeholder`` を渡すと、区切りごとにサイドバーの表を更新する。途中で ``st.stop()``
+    した再実行でも、そこまでの内訳が残る。
+    """
+
+    def __init__(self, started, placeholder=None):
+        self.started = started
+        self.placeholder = placeholder
+        self.phases = {}
+        self._last = started
+        self._history = st.session_state.setdefault("setup_history", [])
+        self._history.append({"run": self._history[-1]["run"] + 1 if self._history else 1})
+        del self._history[:-SETUP_HISTORY_LIMIT]
+
+    def mark(self, phase, at=None):
+        # 前の区切りから now（または at）までを phase の時間とする
+        now = at or time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+        self._history[-1].update({"total_ms": round((now - self.started) * 1000, 1), **self._ms()})
+        self.render()
+
+    def _ms(self):
+        return {f"{phase}_ms": round(seconds * 1000, 1) for phase, seconds in self.phases.items()}
+
+    def render(self):
+        if self.placeholder is None:
+            return
+        with self.placeholder.container():
+            st.markdown("#### 準備時間")
+            st.table([{"処理": phase, "ms": round(seconds * 1000, 1)} for phase, seconds in self.phases.items()])
+            st.caption("直近の再実行（ms）")
+            st.dataframe(list(reversed(self._history)), use_container_width=True, hide_index=True)
+
+
+@st.cache_resource
+def get_app_config():
+    # 認証まわりの設定は再実行のたびに secrets から読み直さない
+    oauth_section = st.secrets.get("google_oauth", {})
+    app_section = st.secrets.get("app", {})
+    return {
+        "client_id": oauth_section.get("client_id"),
+        "client_secret": oauth_section.get("client_secret"),
+        "redirect_uri": oauth_section.get("redirect_uri"),
+        "target_email": st.secrets.get("authentication", {}).get("target_user_email"),
+        "show_timing": bool(app_section.get("show_timing", False)),
+    }
+
+
+@st.cache_resource
+def get_oauth_component(client_id, client_secret):
+    # OAuthの設定はセッションをまたいで同じなので、コンポーネントも1つを使い回す
+    from streamlit_oauth import OAuth2Component
+    return OAuth2Component(client_id, client_secret, AUTHORIZE_ENDPOINT, TOKEN_ENDPOINT)
+
+
+def get_cookie_manager():
+    # 読み込みが終わった CookieManager はセッションに保持し、再実行のたびに作り直さない
+    cookies = st.session_state.get("cookie_manager")
+    if cookies is None or not cookies.ready():
+        from streamlit_cookies_manager import CookieManager
+        cookies = CookieManager()
+        if cookies.ready():
+            st.session_state.cookie_manager = cookies
+    return cookies
+
+
+def email_from_id_token(id_token):
+    # 署名の検証はOAuthのトークン交換で済んでいるので、ペイロードからメールアドレスだけを取り出す
+    payload = id_token.split('.')[1]
+    padded_payload = payload + '=' * (4 - len(payload) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded_payload)).get("email")
+
+
+def get_session_email(id_token):
+    # id_token の解析はトークンが変わったときだけ行う
+    if st.session_state.get("identity_token") != id_token:
+        st.session_state.user_email = email_from_id_token(id_token)
+        st.session_state.identity_token = id_token
+    return st.session_state.user_email
+
+
+@st.cache_resource
+def get_settings():
+    # プロンプトの解析・検証は起動時に一度だけ行い、再実行のたびに繰り返さない
+    return Settings.from_secrets(st.secrets)
+
+
+@st.cache_resource
+def get_wordpress_client():
+    # 記事・再実行をまたいでコネクションプールを共有する
+    return WordPressClient.from_secrets(st.secrets)
+
+
+@st.cache_resource
+def get_content_cache():
+    # 生成結果をディスクに残し、途中で失敗したバッチの再実行で同じ呼び出しを繰り返さない
+    return ContentCache.from_secrets(st.secrets)
+
+
+@st.cache_resource
+def get_job_runner():
+    # ジョブはブラウザのセッションではなくサーバープロセス側のスレッドで進める
+    runner_factory = runner_factory_from_secrets(st.secrets, wp_client=get_wordpress_client(), cache=get_content_cache())
+    job_runner = job_runner_from_secrets(st.secrets, runner_factory)
+    # [jobs] external_worker = true なら worker.py がジョブを実行し、アプリは登録と表示だけを行う
+    if not st.secrets.get("jobs", {}).get("external_worker", False):
+        job_runner.start()
+    return job_runner
+
+
+def show_metrics(job_id, records):
+    # 記事ごと・呼び出しの種類ごとの所要時間、トークン数、推定コスト
+    pricing = pricing_from_secrets(st.secrets)
+    articles = summarize_articles(records, pricing)
+    total_cost = sum(article["cost_usd"] for article in articles)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("推定コスト", f"${total_cost:.4f}")
+    col2.metric("1記事あたり", f"${total_cost / len(articles):.4f}" if articles else "-")
+    col3.metric("トークン数 (入力/出力)", f"{sum(a['input_tokens'] for a in articles):,} / {sum(a['output_tokens'] + a['thinking_tokens'] for a in articles):,}")
+    st.markdown("#### 記事ごと")
+    st.dataframe(articles, use_container_width=True)
+    st.markdown("#### 処理ごと（合計時間の長い順）")
+    st.dataframe(summarize_calls(records, pricing), use_container_width=True)
+    col1, col2 = st.columns(2)
+    col1.download_button("CSVでダウンロード", records_to_csv(records, pricing), file_name=f"job-{job_id}-metrics.csv", mime="text/csv")
+    col2.download_button("JSONでダウンロード", records_to_json(records, pricing), file_name=f"job-{job_id}-metrics.json", mime="application/json")
+
+
+app_config = get_app_config()
+CLIENT_ID = app_config["client_id"]
+CLIENT_SECRET = app_config["client_secret"]
+REDIRECT_URI = app_config["redirect_uri"]
+TARGET_EMAIL = app_config["target_email"]
+# [app] show_timing = true か、URLに ?timing=1 を付けるとサイドバーに準備時間を表示する
+show_timing = app_config["show_timing"] or st.query_params.get("timing") == "1"
+setup_timer = SetupTimer(RERUN_STARTED, st.sidebar.empty() if show_timing else None)
+setup_timer.mark("imports", at=IMPORTS_FINISHED)
+setup_timer.mark("config")
+
+# サーバーの再起動後は、ログインを待たずに最初の再実行で中断されたジョブを再開する。
+# 設定に問題があればログイン後のページでエラーを表示する
+try:
+    get_job_runner()
+except Exception:
+    pass
+setup_timer.mark("job_runner")
+
 # --- Check for Secrets ---
 if not all([CLIENT_ID, CLIENT_SECRET, REDIRECT_URI, TARGET_EMAIL]):
     st.error("必要な認証情報がsecrets.tomlに設定されていません。ファイルを確認してください。")
 else:
-    cookies = CookieManager()
-
-    # --- Authentication ---
-    oauth2 = OAuth2Component(CLIENT_ID, CLIENT_SECRET, AUTHORIZE_ENDPOINT, TOKEN_ENDPOINT)
-
     if "token" not in st.session_state:
+        cookies = get_cookie_manager()
         if cookies.ready():
             token_from_cookie = cookies.get("token")
             if token_from_cookie:
@@ -67,6 +221,8 @@ else:
         st.stop()
 
     if st.session_state.token is None:
+        # --- Authentication ---
+        oauth2 = get_oauth_component(CLIENT_ID, CLIENT_SECRET)
         result = oauth2.authorize_button(
             "Sign in with Google",
             redirect_uri=REDIRECT_URI,
@@ -74,6 +230,7 @@ else:
         )
         if result and "token" in result:
             st.session_state.token = result.get("token")
+            cookies = get_cookie_manager()
             cookies["token"] = json.dumps(st.session_state.token)
             cookies.save()
             st.rerun()
@@ -103,14 +260,11 @@ else:
         user_email = None
         if id_token:
             try:
-                payload = id_token.split('.')[1]
-                padded_payload = payload + '=' * (4 - len(payload) % 4)
-                decoded_payload = base64.urlsafe_b64decode(padded_payload)
-                user_data = json.loads(decoded_payload)
-                user_email = user_data.get("email")
+                user_email = get_session_email(id_token)
             except Exception as e:
                 st.error(f"トークンの解析中にエラーが発生しました: {e}")
                 user_email = None
+        setup_timer.mark("auth")
 
         if user_email == TARGET_EMAIL:
             st.success(f"Logged in as {user_email}")
@@ -118,10 +272,13 @@ else:
 
             # --- Configure APIs ---
             try:
-                openai.api_key = st.secrets["openai"]["api_key"]
+                settings = get_settings()
             except Exception as e:
-                st.error(f"OpenAI APIキーの設定中にエラーが発生しました: {e}")
+                st.error(f"APIキー・WordPress・プロンプトの設定中にエラーが発生しました: {e}")
                 st.stop()
+            setup_timer.mark("settings")
+            with st.expander("プロンプト設定"):
+                st.table(settings.prompts.report())
 
 
             # --- Main Application Page ---
@@ -155,41 +312,28 @@ else:
             if st.button("記事を生成してWordPressに投稿", key="generate_and_post_button"):
                 articles_to_generate = []
                 if uploaded_file is not None:
+                    # CSVは全体を読み込まず、ジョブのスレッドで1行ずつ検証しながら登録する
                     try:
-                        stringio = io.StringIO(uploaded_file.getvalue().decode("utf-8-sig"))
-                        csv_reader = csv.reader(stringio)
-                        for row in csv_reader:
-                            if not row or not row[0].strip(): continue
-                            
-                            keyword_data = row[0]
-                            aff_html = row[1] if len(row) > 1 else ""
-                            main_kw, heading_kws = "", ""
-
-                            if "メインキーワード:" in keyword_data and "見出し用キーワードリスト:" in keyword_data:
-                                parts = keyword_data.split("見出し用キーワードリスト:")
-                                main_kw = parts[0].replace("メインキーワード:", "").strip()
-                                heading_kws = parts[1].strip()
-                            else:
-                                main_kw = keyword_data.strip()
-                            
-                            articles_to_generate.append({
-                                "main_keyword": main_kw,
-                                "heading_keywords_list": heading_kws,
-                                "affiliate_html": aff_html
-                            })
-                        
-                        if not articles_to_generate:
-                            st.error("CSVファイルが空か、内容が不正です。")
-                            st.stop()
+                        uploaded_file.seek(0)
+                        reader = ArticleCsvReader(decode_stream(uploaded_file))
+                        csv_articles = iter(reader)
+                        # 最初の有効な行までは先に読み、使える行が1つもなければすぐに知らせる
+                        first_article = next(csv_articles, None)
                     except Exception as e:
                         st.error(f"CSVファイルの読み込み中にエラーが発生しました: {e}")
                         st.stop()
-                elif keyword.strip() and "メインキーワード:" in keyword:
-                    main_kw, heading_kws = "", ""
-                    if "メインキーワード:" in keyword and "見出し用キーワードリスト:" in keyword:
-                        parts = keyword.split("見出し用キーワードリスト:")
-                        main_kw = parts[0].replace("メインキーワード:", "").strip()
-                        heading_kws = parts[1].strip()
+                    if first_article is None:
+                        st.error("CSVファイルが空か、内容が不正です。")
+                        for error in reader.errors[:20]:
+                            st.write(f"- {error['line']}行目: {error['message']}")
+                        st.stop()
+                    st.session_state.job_id = get_job_runner().submit_stream(
+                        itertools.chain([first_article], csv_articles), reservation_date, reader
+                    )
+                    st.rerun()
+                elif keyword.strip() and MAIN_KEYWORD_LABEL in keyword:
+                    if HEADING_KEYWORDS_LABEL in keyword:
+                        main_kw, heading_kws = parse_keyword_cell(keyword)
                         articles_to_generate.append({
                             "main_keyword": main_kw,
                             "heading_keywords_list": heading_kws,
@@ -203,306 +347,118 @@ else:
                     st.stop()
 
                 if articles_to_generate:
-                    st.session_state.articles_to_generate = articles_to_generate
-                    st.session_state.current_article_index = 0
-                    st.session_state.process_status = "start_processing"
-                    st.session_state.completed_articles = []
-                    st.session_state.reservation_date = reservation_date  # 予約日をセッションに保存
+                    st.session_state.job_id = get_job_runner().submit(articles_to_generate, reservation_date)
                     st.rerun()
 
-            # --- Status Display and Backend Logic ---
-            if "process_status" in st.session_state:
-                status_placeholder = st.empty()
-                current_index = st.session_state.get("current_article_index", 0)
-                articles = st.session_state.get("articles_to_generate", [])
-                total_articles = len(articles)
-                progress_text = f"({current_index + 1}/{total_articles}) " if total_articles > 1 else ""
-
-                status_map = {
-                    "start_processing": "処理開始...",
-                    "generating_outline": f"{progress_text}記事構成案を生成中...",
-                    "generating_article": f"{progress_text}記事を生成中...",
-                    "generating_images": f"{progress_text}画像を生成中...",
-                    "posting_to_wordpress": f"{progress_text}WordPressに投稿中...",
-                    "all_done": "全記事の投稿が完了しました！"
-                }
-                display_status = status_map.get(st.session_state.process_status, st.session_state.process_status)
-                if st.session_state.process_status != "all_done":
-                    status_placeholder.write(f"処理状況： {display_status}")
-
-                current_main_keyword = st.session_state.get("main_keyword")
-
-                def setup_gemini_client():
-                    client = genai.Client(api_key=st.secrets["gemini"]["api_key"])
-                    tools = [types.Tool(googleSearch=types.GoogleSearch())]
-                    config = types.GenerateContentConfig(
-                        thinking_config=types.ThinkingConfig(thinking_budget=-1),
-                        tools=tools
-                    )
-                    return client, config
-
-                def generate_with_gemini(prompt, client=None, config=None):
-                    if client is None or config is None:
-                        client, config = setup_gemini_client()
-                    response = client.models.generate_content(
-                        model='gemini-2.5-flash',
-                        contents=[types.Content(
-                            role="user",
-                            parts=[types.Part.from_text(text=prompt)]
-                        )],
-                        config=config
-                    )
-                    return response.text
-
-                def handle_error(e, step):
-                    error_message = f"失敗: {step}でエラーが発生しました。詳細: {str(e)}"
-                    st.error(error_message)
-                    st.session_state.completed_articles.append({"title": current_main_keyword, "status": error_message})
-                    st.session_state.current_article_index += 1
-                    st.session_state.process_status = "start_processing"
-                    st.rerun()
-
-                if st.session_state.process_status == "start_processing":
-                    if current_index < total_articles:
-                        article_data = articles[current_index]
-                        st.session_state.main_keyword = article_data["main_keyword"]
-                        st.session_state.heading_keywords_list = article_data["heading_keywords_list"]
-                        st.session_state.affiliate_html = article_data["affiliate_html"]
-                        st.session_state.generated_outline, st.session_state.generated_article, st.session_state.generated_images = None, None, []
-                        st.session_state.process_status = "generating_outline"
-                        st.rerun()
-                    else:
-                        st.session_state.process_status = "all_done"
-                        st.rerun()
-
-                current_heading_keywords_list = st.session_state.get("heading_keywords_list")
-
-                if st.session_state.process_status == "generating_outline":
-                    try:
-                        midashi_prompt_template = st.secrets["prompts"]["midashi_prompt"]
-                        midashi_prompt = midashi_prompt_template.replace("｛チャットで入力した▼メインキーワード｝", current_main_keyword).replace("｛チャットで入力した▼見出し用キーワードリスト｝", current_heading_keywords_list)
-                        midashi_response = generate_with_gemini(midashi_prompt)
-                        st.session_state.generated_outline = midashi_response
-                        st.session_state.process_status = "generating_article"
-                        st.rerun()
-                    except Exception as e:
-                        handle_error(e, "記事構成案生成")
-
-                elif st.session_state.process_status == "generating_article":
-                    try:
-                        generated_outline = st.session_state.get("generated_outline")
-                        if not generated_outline: raise ValueError("記事構成案が生成されていません。")
-                        
-                        article_prompt_template = st.secrets["prompts"]["article_prompt"]
-                        article_prompt = article_prompt_template.replace("｛チャットで入力した▼メインキーワード｝", current_main_keyword).replace("｛チャットで入力した▼見出し用キーワードリスト｝", current_heading_keywords_list).replace("｛チャットで入力した▼記事構成案｝", generated_outline)
-                        
-                        article_response = generate_with_gemini(article_prompt)
-                        st.session_state.generated_article = article_response
-                        st.session_state.process_status = "generating_images"
-                        st.rerun()
-                    except Exception as e:
-                        handle_error(e, "記事生成")
+            # --- Status Display ---
+            job_runner = get_job_runner()
+            job_store = job_runner.store
+
+            if st.session_state.get("job_id") is None:
+                recent_jobs = job_store.list_jobs(limit=10)
+                if recent_jobs:
+                    with st.expander("ジョブ一覧"):
+                        for job in recent_jobs:
+                            created = datetime.datetime.fromtimestamp(job["created_at"]).strftime("%Y-%m-%d %H:%M")
+                            label = f"#{job['id']} ({created}, {job['total']}件) {JOB_STATUS_LABELS.get(job['status'], job['status'])}"
+                            if st.button(label, key=f"show_job_{job['id']}"):
+                                st.session_state.job_id = job["id"]
+                                st.rerun()
+
+            # 実行中はこの部分だけを定期的に再描画し、ジョブの状態をストアから読み直す
+            @st.fragment(run_every=1.0)
+            def show_job_progress(job_id):
+                job = job_store.job(job_id)
+                if job["status"] not in ("queued", "running"):
+                    st.rerun(scope="app")
+                counts = job_store.status_counts(job_id)
+                total_articles = sum(counts.values())
+                if total_articles > PROGRESS_TABLE_LIMIT:
+                    rows = job_store.rows(job_id, exclude_statuses=("queued", "done", "failed"), limit=PROGRESS_TABLE_LIMIT)
+                else:
+                    rows = job_store.rows(job_id)
 
-                elif st.session_state.process_status == "generating_images":
-                    try:
-                        st.write("--- 挿絵生成情報 ---")
-                        sashie_prompt_template = st.secrets["prompts"]["sashie_pronpt"]
-                        article_content_for_sashie = f"メインキーワード: {current_main_keyword}\n見出し用キーワードリスト: {current_heading_keywords_list}\n記事本文: {st.session_state.get('generated_article', '')}"
-                        sashie_prompt = sashie_prompt_template.replace("{article_content}", article_content_for_sashie)
-                        st.write("挿絵生成用プロンプトをGeminiで生成中...")
-                        
-                        sashie_response = generate_with_gemini(sashie_prompt)
-                        dall_e_prompt = sashie_response.strip()
-                        st.write(f"DALL-E用挿絵プロンプト: {dall_e_prompt}")
-                        
-                        st.session_state.generated_images = []
-                        for i in range(6):
-                            st.write(f"挿絵 {i+1}/6 を生成中...")
-                            try:
-                                response = openai.images.generate(model="dall-e-3", prompt=dall_e_prompt, n=1, size="1792x1024", response_format="url")
-                                image_url = response.data[0].url
-                                img_response = requests.get(image_url)
-                                image_bytes = img_response.content
-                                image = Image.open(io.BytesIO(image_bytes))
-                                st.session_state.generated_images.append({'bytes': image_bytes, 'mime_type': "image/png", 'image': image})
-                            except Exception as e:
-                                st.warning(f"挿絵 {i+1} の生成中にエラー: {e}")
-                                continue
-                            time.sleep(1)
-                        if not st.session_state.generated_images:
-                            st.warning("挿絵の生成に失敗しましたが、記事の投稿は続行します。")
-                        st.session_state.process_status = "posting_to_wordpress"
-                        st.rerun()
-                    except Exception as e:
-                        st.warning(f"挿絵生成プロセス全体でエラーが発生しました: {e}。画像なしで投稿を続行します。")
-                        st.session_state.process_status = "posting_to_wordpress"
-                        st.rerun()
+                finished = counts.get("done", 0) + counts.get("failed", 0)
+                ingesting = "（CSVを読み込み中）" if job["ingesting"] else ""
+                if job["status"] == "queued":
+                    st.write(f"処理状況： 他のジョブの完了を待っています...{ingesting}")
+                else:
+                    st.write(f"処理状況： ({finished}/{total_articles}) 件完了{ingesting}")
+                    if total_articles > PROGRESS_TABLE_LIMIT:
+                        st.caption(f"成功 {counts.get('done', 0)}件 / 失敗 {counts.get('failed', 0)}件 / 待機中 {counts.get('queued', 0)}件。処理中の行だけを表示しています。")
+                table = ["| # | 記事 | ステータス |", "|---|---|---|"]
+                for row in rows:
+                    table.append(f"| {row['row_index']+1} | {row['title'] or row['main_keyword']} | {STATUS_LABELS.get(row['status'], row['status'])} |")
+                st.markdown("\n".join(table))
+
+                events = job_store.events(job_id, limit=EVENT_LOG_LIMIT)
+                if events:
+                    with st.expander("処理ログ"):
+                        if len(events) == EVENT_LOG_LIMIT:
+                            event_count = job_store.event_count(job_id)
+                            if event_count > EVENT_LOG_LIMIT:
+                                st.caption(f"最新の{EVENT_LOG_LIMIT}件を表示しています（全{event_count}件）。")
+                        for event in events:
+                            prefix = f"({event['row_index'] + 1}/{total_articles}) " if total_articles > 1 and event["row_index"] is not None else ""
+                            if event["level"] == "info":
+                                st.write(f"{prefix}{event['message']}")
+                            else:
+                                st.warning(f"{prefix}{event['message']}")
 
-                elif st.session_state.process_status == "posting_to_wordpress":
-                    try:
-                        wp_url = st.secrets["wordpress"]["url"].rstrip('/')
-                        wp_user = st.secrets["wordpress"]["username"]
-                        wp_pass = st.secrets["wordpress"]["app_password"]
-                        credentials = f"{wp_user}:{wp_pass}"
-                        token = base64.b64encode(credentials.encode())
-                        headers = {'Authorization': f'Basic {token.decode("utf-8")}'}
-                        
-                        uploaded_image_ids, image_urls = [], []
-                        if st.session_state.get("generated_images"):
-                            st.write("挿絵をWordPressにアップロード中...")
-                            for i, image_data in enumerate(st.session_state.generated_images):
-                                files = {'file': (f"sashie-{i+1}.png", image_data['bytes'], "image/png")}
-                                media_data_payload = {'alt_text': f"{current_main_keyword}の挿絵{i+1}"}
-                                upload_response = requests.post(f"{wp_url}/media", headers=headers, files=files, data=media_data_payload)
-                                if upload_response.ok:
-                                    media_data = upload_response.json()
-                                    uploaded_image_ids.append(media_data['id'])
-                                    image_urls.append(media_data['source_url'])
-                                else:
-                                    st.warning(f"挿絵 {i+1} のアップロードに失敗: {upload_response.text}")
-
-                        article_content = st.session_state.generated_article
-                        if image_urls:
-                            lines = article_content.split('\n')
-                            new_lines = []
-                            image_index = 0
-                            for line in lines:
-                                new_lines.append(line)
-                                if '<h3>' in line and image_index < len(image_urls):
-                                    new_lines.append(f'<img src="{image_urls[image_index]}" alt="{current_main_keyword}の挿絵{image_index+1}" style="max-width: 100%; height: auto; margin: 20px 0;" />')
-                                    image_index += 1
-                            article_content = '\n'.join(new_lines)
-                        
-                        lines = article_content.split('\n')
-                        if len(lines) > 2: article_content = '\n'.join(lines[1:-1])
-                        
-                        article_content = re.sub(r'\s*\[\d+(,\d+)*\]$', '', article_content.strip())
-
-                        affiliate_html = st.session_state.get("affiliate_html", "")
-                        if affiliate_html.strip():
-                            wrapped_affiliate_html = f"<!-- wp:html -->\n{affiliate_html}\n<!-- /wp:html -->"
-                            article_content = article_content.replace("{アフィリエイト}", wrapped_affiliate_html)
-                        else:
-                            article_content = article_content.replace("{アフィリエイト}", "")
-
-                        title_prompt_template = st.secrets["prompts"]["title_prompt"]
-                        title_prompt = title_prompt_template.replace("｛チャットで入力した▼メインキーワード｝", current_main_keyword).replace("{article_content}", article_content)
-                        title_response = generate_with_gemini(title_prompt)
-                        title = title_response.strip()
-
-                        # パーマリンク生成
-                        permalink_prompt_template = st.secrets["prompts"]["permalink_prompt"]
-                        permalink_prompt = permalink_prompt_template.replace("{blog_title}", title)
-                        slug = generate_with_gemini(permalink_prompt).strip()
-
-                        #カテゴリー生成
-                        category_prompt_template = st.secrets["prompts"]["category_prompt"]
-                        category_prompt = category_prompt_template.replace("{article_content}", article_content)
-                        category_response = generate_with_gemini(category_prompt)
-                        category = category_response.strip()
-                        # カテゴリー名称のリスト
-                        category_names = ["PC家電", "生活雑貨", "美容", "食品", "飲料", "キッチン", "インテリア", "ファッション", "アパレル", "キッズベビー", "趣味", "ホビー", "ゲーム"]
-                        if category not in category_names:
-                            category = "どこで買える"
-
-                        # カテゴリーの処理
-                        try:
-                            # カテゴリーの取得
-                            categories_response = requests.get(f"{wp_url}/categories", headers=headers, params={'per_page': 100})
-                            if not categories_response.ok:
-                                raise Exception(f"カテゴリー情報の取得に失敗: {categories_response.text}")
-                            
-                            categories = categories_response.json()
-                            category_id = None
-                            
-                            # 既存のカテゴリーから検索
-                            for cat in categories:
-                                if cat['name'].lower() == category.lower():  # 大文字小文字を区別しない比較
-                                    category_id = cat['id']
-                                    break
-                            
-                            # カテゴリーが存在しない場合は新規作成
-                            if category_id is None:
-                                new_category = {
-                                    'name': category,
-                                    'description': f'「{category}」に関する記事一覧'
-                                }
-                                create_response = requests.post(f"{wp_url}/categories", headers=headers, json=new_category)
-                                if not create_response.ok:
-                                    raise Exception(f"カテゴリーの作成に失敗: {create_response.text}")
-                                category_id = create_response.json()['id']
-                            
-                            # カテゴリーIDをセッションに保存
-                            st.session_state.generated_category_id = category_id
-                            
-                        except Exception as e:
-                            st.warning(f"カテゴリー処理中にエラー: {str(e)}")
-                            category_id = None
-                        
-                        # 投稿日を計算
-                        post_date = st.session_state.reservation_date + datetime.timedelta(days=current_index)
-                        post_date_iso = post_date.isoformat() + "T12:00:00"
-
-                        # 投稿データの作成
-                        post = {
-                            'title': title,
-                            'content': article_content,
-                            'status': 'draft',
-                            'date': post_date_iso,
-                            'slug': slug,
-                            'featured_media': uploaded_image_ids[0] if uploaded_image_ids else 0,
-                            'categories': [category_id] if category_id else []
-                        }
-                        
-                        response = requests.post(f"{wp_url}/posts", headers=headers, json=post)
-
-                        if response.ok:
-                            st.session_state.completed_articles.append({"title": title, "status": "成功"})
+                preview = job_runner.preview(job_id)
+                if preview and preview.get("article"):
+                    with st.expander("現在生成中の記事プレビュー", expanded=True):
+                        st.markdown("#### 生成された挿絵")
+                        if preview.get("images"):
+                            for i, image_data in enumerate(preview["images"]):
+                                if image_data.get('thumbnail'):
+                                    st.image(image_data['thumbnail'], caption=f"挿絵 {i+1}")
                         else:
-                            error_message = response.text
-                            if "text/html" in response.headers.get("Content-Type", ""): error_message = "WordPressサーバーから予期せぬHTML応答 (404等)"
-                            st.session_state.completed_articles.append({"title": title or current_main_keyword, "status": f"失敗: {error_message[:100]}"})
-                        
-                        st.session_state.current_article_index += 1
-                        st.session_state.process_status = "start_processing"
-                        st.rerun()
-                    except Exception as e:
-                        handle_error(e, "WordPress投稿")
-
-                elif st.session_state.process_status == "all_done":
-                    status_placeholder.empty()
-                    st.success("全ての処理が完了しました！")
+                            st.write("挿絵はありません。")
+                        st.markdown("#### 生成された記事")
+                        if preview.get("streaming"):
+                            st.caption("生成中...")
+                        st.markdown(preview["article"])
+
+            job_id = st.session_state.get("job_id")
+            if job_id is not None:
+                job = job_store.job(job_id)
+                if job is None:
+                    st.session_state.job_id = None
+                    st.rerun()
+                if job["status"] in ("queued", "running"):
+                    show_job_progress(job_id)
+                else:
+                    if job["status"] == "failed":
+                        st.error("ジョブの実行中にエラーが発生しました。")
+                    else:
+                        st.success("全ての処理が完了しました！")
                     st.markdown("### 処理結果")
-                    completed = st.session_state.get("completed_articles", [])
-                    if completed:
-                        for result in completed:
-                            st.write(f"- **記事:** {result.get('title', 'N/A')}  **ステータス:** {result.get('status', 'N/A')}")
+                    rows = job_store.rows(job_id)
+                    if len(rows) > PROGRESS_TABLE_LIMIT:
+                        st.dataframe(
+                            [{"#": row["row_index"] + 1, "記事": row["title"] or row["main_keyword"], "ステータス": row["result"] or "N/A"} for row in rows],
+                            use_container_width=True,
+                        )
+                    elif rows:
+                        for row in rows:
+                            st.write(f"- **記事:** {row['title'] or row['main_keyword']}  **ステータス:** {row['result'] or 'N/A'}")
                     else:
                         st.write("処理された記事はありません。")
-                    
-                    for key in list(st.session_state.keys()):
-                        if key not in ['token']:
-                            del st.session_state[key]
+                    metric_records = job_store.metrics(job_id)
+                    if metric_records:
+                        with st.expander("処理時間・トークン数・コスト"):
+                            show_metrics(job_id, metric_records)
                     if st.button("リセット"):
+                        st.session_state.job_id = None
                         st.rerun()
 
 
-                if "generated_article" in st.session_state and st.session_state.generated_article and st.session_state.process_status != 'all_done':
-                    with st.expander("現在生成中の記事プレビュー", expanded=True):
-                        st.markdown("#### 生成された挿絵")
-                        if st.session_state.get("generated_images"):
-                            for i, image_data in enumerate(st.session_state.generated_images):
-                                st.image(image_data['image'], caption=f"挿絵 {i+1}")
-                        else:
-                            st.write("挿絵はありません。")
-                        st.markdown("#### 生成された記事")
-                        st.markdown(st.session_state.generated_article)
-
         elif user_email:
             st.error(f"アクセスが許可されていません。現在 {user_email} でログインしています。")
             if st.button("ログアウト"):
                 st.session_state.token = None
-                cookies.delete("token")
+                get_cookie_manager().delete("token")
                 st.rerun()
         else:
             st.error("Googleアカウントのメールアドレスを取得できませんでした。")
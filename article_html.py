@@ -0,0 +1,180 @@
+"""生成された記事HTMLを投稿用に整える変換。
+
+各処理は「行のイテレーターを受け取って行を返すジェネレーター」なので、``render_article``
+はそれらをつないで本文を1回だけ走査する。Geminiのストリーミング出力のようなチャンク列も
+``iter_lines`` で行に分けてそのまま流せる。
+"""
+import html
+import io
+import re
+
+AFFILIATE_PLACEHOLDER = "{アフィリエイト}"
+STANDALONE_PLACEHOLDERS = (AFFILIATE_PLACEHOLDER, f"<p>{AFFILIATE_PLACEHOLDER}</p>")
+
+# Google検索のグラウンディングで本文に付く引用番号（[1] や [2, 5]、[1][3]）。直前の文字は
+# _remove_citation で確かめる。先頭の先読みは、空白と [ 以外の位置での照合をすぐに打ち切るため
+CITATION_MARKER = r"\[\d{1,2}(?:,\s*\d{1,2})*\]"
+CITATION_PATTERN = re.compile(rf"(?=[\s\[])(\s*){CITATION_MARKER}(?:\s*{CITATION_MARKER})*(?![A-Za-z0-9_\[(])")
+FENCE_PATTERN = re.compile(r"^\s*```")
+HEADING_PATTERN = re.compile(r"^<h([1-6])(?:\s[^>]*)?>")
+BLOCK_COMMENT_PATTERN = re.compile(r"^<!--\s*(/?)wp:")
+TAG_PATTERN = re.compile(r"^<(\w+)")
+
+# 複数行にまたがる要素と、対応するブロック名
+MULTILINE_BLOCKS = {
+    "ul": "list",
+    "ol": "list",
+    "table": "table",
+    "blockquote": "quote",
+}
+
+
+def iter_lines(source):
+    """文字列、またはチャンクのイテレーターを改行なしの行に分けて返す。"""
+    if isinstance(source, str):
+        for line in io.StringIO(source):
+            yield line.rstrip("\r\n")
+        return
+    pending = ""
+    for chunk in source:
+        pending += chunk
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    if pending:
+        yield pending
+
+
+def strip_fences(lines):
+    # モデルが付けるコードフェンス（```html と ```）の行だけを取り除く。位置には依存しない
+    for line in lines:
+        if not FENCE_PATTERN.match(line):
+            yield line
+
+
+def _remove_citation(match):
+    # 文や句読点の直後（英数字の後は空白を挟んだ場合）に付く番号だけを消し、本文の [2024] や arr[0]、
+    # 行や要素の先頭の [1] は残す
+    start = match.start()
+    previous = match.string[start - 1] if start else ""
+    if not previous or previous in "[]>":
+        return match.group(0)
+    if not match.group(1) and previous.isascii() and (previous.isalnum() or previous == "_"):
+        return match.group(0)
+    return ""
+
+
+def strip_citations(lines):
+    for line in lines:
+        yield CITATION_PATTERN.sub(_remove_citation, line) if "[" in line else line
+
+
+def place_images(lines, image_urls, main_keyword):
+    # <h3> の行の直後に挿絵を1枚ずつ入れる
+    image_urls = list(image_urls)
+    image_index = 0
+    for line in lines:
+        yield line
+        if image_index < len(image_urls) and '<h3>' in line:
+            yield f'<img src="{image_urls[image_index]}" alt="{main_keyword}の挿絵{image_index+1}" style="max-width: 100%; height: auto; margin: 20px 0;" />'
+            image_index += 1
+
+
+def inject_affiliate(lines, affiliate_html):
+    replacement = f"<!-- wp:html -->\n{affiliate_html}\n<!-- /wp:html -->" if affiliate_html.strip() else ""
+    for line in lines:
+        if AFFILIATE_PLACEHOLDER not in line:
+            yield line
+            continue
+        # プレースホルダーだけの段落は段落ごと置き換え、ブロックを <p> の中に入れない
+        if line.strip() in STANDALONE_PLACEHOLDERS:
+            line = AFFILIATE_PLACEHOLDER
+        # 置き換え後の複数行も1行ずつ後段に渡す
+        yield from line.replace(AFFILIATE_PLACEHOLDER, replacement).split("\n")
+
+
+def _block(name, body, attributes=""):
+    # attributes はJSON文字列（例: '{"level":3}'）。見出しやリストごとに固定なのでその都度シリアライズしない
+    return f"<!-- wp:{name}{' ' + attributes if attributes else ''} -->\n{body}\n<!-- /wp:{name} -->"
+
+
+def _list_attributes(tag):
+    return '{"ordered":true}' if tag == "ol" else ""
+
+
+def _single_line_block(line):
+    stripped = line.strip()
+    heading = HEADING_PATTERN.match(stripped)
+    if heading:
+        level = int(heading.group(1))
+        body = stripped.replace(f"<h{level}", f'<h{level} class="wp-block-heading"', 1) if "class=" not in heading.group(0) else stripped
+        return _block("heading", body, "" if level == 2 else f'{{"level":{level}}}')
+    if stripped.startswith("<img"):
+        return _block("image", f'<figure class="wp-block-image">{stripped}</figure>')
+    if stripped.startswith("<p"):
+        return _block("paragraph", stripped)
+    if stripped.startswith("<"):
+        return _block("html", stripped)
+    return _block("paragraph", f"<p>{stripped}</p>")
+
+
+def to_blocks(lines):
+    """HTMLの各要素をブロックエディターのブロックコメントで囲む。
+
+    既にブロックコメントで囲まれた部分（アフィリエイトHTMLなど）はそのまま通し、
+    リスト・表・引用は閉じタグの行までを1つのブロックにまとめる。
+    """
+    open_block = None
+    buffered = []
+    depth = 0
+    for line in lines:
+        stripped = line.strip()
+        if depth:
+            yield line
+            comment = BLOCK_COMMENT_PATTERN.match(stripped)
+            if comment:
+                depth += -1 if comment.group(1) else 1
+            continue
+        if open_block:
+            buffered.append(line)
+            tag, name = open_block
+            if f"</{tag}>" in stripped:
+                yield _block(name, "\n".join(buffered), _list_attributes(tag))
+                open_block, buffered = None, []
+            continue
+        if not stripped:
+            continue
+        comment = BLOCK_COMMENT_PATTERN.match(stripped)
+        if comment:
+            yield line
+            if not comment.group(1) and not stripped.endswith("/-->"):
+                depth = 1
+            continue
+        tag = TAG_PATTERN.match(stripped)
+        if tag and tag.group(1) in MULTILINE_BLOCKS and f"</{tag.group(1)}>" not in stripped:
+            open_block = (tag.group(1), MULTILINE_BLOCKS[tag.group(1)])
+            buffered = [line]
+            continue
+        if tag and tag.group(1) in MULTILINE_BLOCKS:
+            yield _block(MULTILINE_BLOCKS[tag.group(1)], stripped, _list_attributes(tag.group(1)))
+            continue
+        yield _single_line_block(line)
+    if buffered:
+        # 閉じタグがないまま終わった場合は崩さずにカスタムHTMLとして残す
+        yield _block("html", "\n".join(buffered))
+
+
+def render_article(article, image_urls, main_keyword, affiliate_html, blocks=False):
+    """生成された本文を投稿用のHTMLにする。
+
+    フェンスの除去・引用番号の除去・挿絵の配置・アフィリエイトHTMLの差し込みを
+    （``blocks`` ならブロックエディター形式への変換も）1回の走査で行う。
+    ``article`` は文字列でもチャンクのイテレーターでもよい。
+    """
+    lines = strip_fences(iter_lines(article))
+    lines = strip_citations(lines)
+    lines = place_images(lines, image_urls, html.escape(main_keyword, quote=True))
+    lines = inject_affiliate(lines, affiliate_html)
+    if blocks:
+        lines = to_blocks(lines)
+    return "\n".join(lines).strip()
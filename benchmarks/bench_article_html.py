@@ -0,0 +1,116 @@
+"""記事本文の後処理（挿絵の配置・フェンス/引用番号の除去・アフィリエイト差し込み）の速度を比べる。
+
+以前の ``build_article_content``（分割と結合を繰り返す実装）と ``article_html.render_article``
+を、見出しの数を変えた長い記事で実行し、1記事あたりの所要時間とピークメモリを表示する。
+計測の前に、引用番号の除去が本文中の角括弧つきの数字（[2024] や arr[0]）を消さないことも確かめる。
+
+    python benchmarks/bench_article_html.py --sections 50 500 5000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from article_html import render_article, strip_citations  # noqa: E402
+
+IMAGE_URLS = [f"https://example.com/wp-content/uploads/sashie-{i+1}.png" for i in range(6)]
+AFFILIATE_HTML = '<a href="https://example.com/item" target="_blank">商品リンク</a>'
+# 引用番号の除去の入力と期待する出力。前半はグラウンディングの引用番号、後半は本文なので残す
+CITATION_EXAMPLES = [
+    ("<p>効果が期待できます。[1]</p>", "<p>効果が期待できます。</p>"),
+    ("<p>効果が期待できます[1, 3]。</p>", "<p>効果が期待できます。</p>"),
+    ("<p>保湿が大切です[2][5]</p>", "<p>保湿が大切です</p>"),
+    ("<p>It works well [4].</p>", "<p>It works well.</p>"),
+    ("<p>価格は[2024]年版 arr[0]</p>", "<p>価格は[2024]年版 arr[0]</p>"),
+    ("<p>matrix[1][2] と list[10]</p>", "<p>matrix[1][2] と list[10]</p>"),
+    ("<li>[1] 先頭の番号</li>", "<li>[1] 先頭の番号</li>"),
+]
+
+
+def legacy_build_article_content(article, image_urls, main_keyword, affiliate_html):
+    # 比較用に残した以前の実装
+    article_content = article
+    if image_urls:
+        lines = article_content.split('\n')
+        new_lines = []
+        image_index = 0
+        for line in lines:
+            new_lines.append(line)
+            if '<h3>' in line and image_index < len(image_urls):
+                new_lines.append(f'<img src="{image_urls[image_index]}" alt="{main_keyword}の挿絵{image_index+1}" style="max-width: 100%; height: auto; margin: 20px 0;" />')
+                image_index += 1
+        article_content = '\n'.join(new_lines)
+
+    lines = article_content.split('\n')
+    if len(lines) > 2: article_content = '\n'.join(lines[1:-1])
+
+    article_content = re.sub(r'\s*\[\d+(,\d+)*\]$', '', article_content.strip())
+
+    if affiliate_html.strip():
+        wrapped_affiliate_html = f"<!-- wp:html -->\n{affiliate_html}\n<!-- /wp:html -->"
+        article_content = article_content.replace("{アフィリエイト}", wrapped_affiliate_html)
+    else:
+        article_content = article_content.replace("{アフィリエイト}", "")
+    return article_content
+
+
+def build_article(sections):
+    parts = ["```html"]
+    for i in range(sections):
+        parts.append(f"<h2>見出し{i}</h2>" if i % 5 == 0 else f"<h3>小見出し{i}</h3>")
+        parts.append(f"<p>{'本文のダミーテキストです。' * 15}[{i % 7 + 1}]</p>")
+        if i % 10 == 0:
+            parts.append("<ul>\n<li>ポイント1</li>\n<li>ポイント2</li>\n</ul>")
+            parts.append("<p>[2024]年版の比較表では arr[0] のように角括弧つきの数字も使います。</p>")
+    parts.append("<p>{アフィリエイト}</p>")
+    parts.append("```")
+    return "\n".join(parts)
+
+
+def check_citations():
+    failures = 0
+    for source, expected in CITATION_EXAMPLES:
+        actual = next(strip_citations([source]))
+        if actual != expected:
+            failures += 1
+            print(f"  citation mismatch: {source!r} -> {actual!r} (expected {expected!r})")
+    print(f"citation examples: {len(CITATION_EXAMPLES) - failures}/{len(CITATION_EXAMPLES)} ok")
+    return failures == 0
+
+
+def measure(label, fn, article, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(article)
+    elapsed = (time.perf_counter() - started) / repeat
+    # tracemalloc は実行を遅くするので、時間とは別に1回だけ計測する
+    tracemalloc.start()
+    fn(article)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  {label:<22} {elapsed * 1000:9.3f} ms  peak={peak / 1024:9.1f} KiB")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, nargs="+", default=[50, 500, 5000], help="記事の見出し数（複数指定可）")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if not check_citations():
+        sys.exit(1)
+    for sections in args.sections:
+        article = build_article(sections)
+        print(f"{sections} sections ({len(article):,} chars)")
+        measure("build_article_content", lambda text: legacy_build_article_content(text, IMAGE_URLS, "キーワード", AFFILIATE_HTML), article, args.repeat)
+        measure("render_article", lambda text: render_article(text, IMAGE_URLS, "キーワード", AFFILIATE_HTML), article, args.repeat)
+        measure("render_article blocks", lambda text: render_article(text, IMAGE_URLS, "キーワード", AFFILIATE_HTML, blocks=True), article, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""CSV → 構成案 → 本文 → 挿絵 → 投稿 の一連の処理をローカルのスタンドインで計測する。
+
+Gemini・DALL-E・WordPressをそれぞれ ``fake_gemini`` / ``fake_openai`` / ``fake_wordpress``
+に置き換え、実際のAPI料金や公開サイトへの投稿なしに ``runner_factory_from_secrets`` から
+同じ処理を実行する。行数ごとにスループット（記事/分）、ステージごとのp50/p95所要時間、
+ピークメモリを表示する。
+
+    python benchmarks/bench_pipeline.py --rows 1 10 100 --gemini-latency 0.5 --image-latency 1.0
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_gemini import start_fake_gemini  # noqa: E402
+from benchmarks.fake_openai import start_fake_openai  # noqa: E402
+from benchmarks.fake_wordpress import start_fake_wordpress  # noqa: E402
+from cache import ContentCache  # noqa: E402
+from ingest import read_articles_csv  # noqa: E402
+from metrics import summarize_calls  # noqa: E402
+from pipeline import runner_factory_from_secrets  # noqa: E402
+from wordpress import WordPressClient  # noqa: E402
+
+STAGES = {
+    "generating_outline": "outline",
+    "generating_article": "article",
+    "generating_images": "images",
+    "posting_to_wordpress": "post",
+}
+
+PROMPTS = {
+    "midashi_prompt": "「｛チャットで入力した▼メインキーワード｝」の記事構成案を作成してください。見出し: ｛チャットで入力した▼見出し用キーワードリスト｝",
+    "article_prompt": "構成案に沿って記事を書いてください。\n｛チャットで入力した▼記事構成案｝",
+    "sashie_pronpt": "次の記事の挿絵のプロンプトを英語で作成してください。\n{article_content}",
+    "title_prompt": "「｛チャットで入力した▼メインキーワード｝」の記事タイトルを考えてください。\n{article_content}",
+    "permalink_prompt": "「{blog_title}」の英語スラッグを考えてください。",
+    "category_prompt": "次の記事のカテゴリーを選んでください。\n{article_content}",
+}
+
+
+def build_csv(rows):
+    lines = [
+        f'"メインキーワード: 商品{i} どこで買える 見出し用キーワードリスト: 販売店, 値段, 口コミ","<a href=""https://example.com/{i}"">購入</a>"'
+        for i in range(rows)
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def build_secrets(args, gemini, openai_server, wordpress, cache_dir):
+    return {
+        "gemini": {"api_key": "fake", "base_url": gemini.base_url, "stream_article": not args.no_stream},
+        "openai": {"api_key": "fake", "base_url": openai_server.api_url},
+        "wordpress": {"url": wordpress.api_url, "username": "bench", "app_password": "bench",
+                      "bulk_publish": args.bulk_publish, "publish_batch_wait": args.publish_batch_wait},
+        "prompts": PROMPTS,
+        "concurrency": {"articles": args.articles, "prefetch": args.prefetch},
+        "retry": {"base_delay": args.retry_delay, "max_delay": args.retry_delay * 8},
+        "images": {"spool_directory": os.path.join(cache_dir, "images")},
+        "cache": {"enabled": args.cache, "directory": os.path.join(cache_dir, "content")},
+    }
+
+
+def run_batch(secrets, rows, track_memory):
+    records = []
+
+    def on_progress(event):
+        if "metric" in event:
+            records.append(event["metric"])
+
+    articles = list(read_articles_csv(io.StringIO(build_csv(rows))))
+    wp_client = WordPressClient.from_secrets(secrets)
+    runner_factory = runner_factory_from_secrets(secrets, wp_client=wp_client, cache=ContentCache.from_secrets(secrets))
+    if track_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        with runner_factory(on_progress=on_progress) as runner:
+            results = runner.run(articles, datetime.date.today())
+    finally:
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if track_memory else None
+        if track_memory:
+            tracemalloc.stop()
+        wp_client.close()
+
+    stages = {entry["stage"]: entry for entry in summarize_calls(records) if entry["call"] == "stage"}
+    return {
+        "rows": rows,
+        "succeeded": sum(1 for result in results if result.status == "成功"),
+        "seconds": round(elapsed, 3),
+        "articles_per_minute": round(rows / elapsed * 60, 2),
+        "stages": {
+            stage: {"p50": stages[stage]["p50_seconds"], "p95": stages[stage]["p95_seconds"]}
+            for stage in STAGES if stage in stages
+        },
+        "peak_python_mb": round(peak / 1024 / 1024, 1) if peak is not None else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def print_report(report):
+    header = f"{'rows':>5} {'ok':>5} {'seconds':>8} {'art/min':>8} " + " ".join(f"{label + ' p50/p95':>20}" for label in STAGES.values()) + f" {'peak MB':>8} {'rss MB':>8}"
+    print(header)
+    for batch in report:
+        stages = " ".join(
+            f"{batch['stages'][stage]['p50']:>9.2f}/{batch['stages'][stage]['p95']:<10.2f}" if stage in batch["stages"] else f"{'-':>20}"
+            for stage in STAGES
+        )
+        peak = f"{batch['peak_python_mb']:>8.1f}" if batch["peak_python_mb"] is not None else f"{'-':>8}"
+        print(f"{batch['rows']:>5} {batch['succeeded']:>5} {batch['seconds']:>8.2f} {batch['articles_per_minute']:>8.2f} {stages} {peak} {batch['max_rss_mb']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 10, 100], help="計測する行数（複数指定可）")
+    parser.add_argument("--articles", type=int, default=3, help="同時に処理する記事数")
+    parser.add_argument("--prefetch", type=int, default=0, help="構成案・本文を先行して生成する行数")
+    parser.add_argument("--gemini-latency", type=float, default=0.3, help="Geminiの応答開始までの秒数")
+    parser.add_argument("--stream-chunks", type=int, default=10)
+    parser.add_argument("--chunk-interval", type=float, default=0.02, help="ストリーミングのチャンク間隔（秒）")
+    parser.add_argument("--article-chars", type=int, default=6000, help="生成される本文のおおよその文字数")
+    parser.add_argument("--image-latency", type=float, default=0.5, help="DALL-Eの画像生成にかかる秒数")
+    parser.add_argument("--download-latency", type=float, default=0.05)
+    parser.add_argument("--image-size", default="1792x1024", help="返すPNGの大きさ（ファイルサイズに影響）")
+    parser.add_argument("--wp-latency", type=float, default=0.05)
+    parser.add_argument("--handshake-latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="各スタンドインがエラーを返す割合")
+    parser.add_argument("--retry-delay", type=float, default=0.05, help="再試行の基本待ち時間（秒）")
+    parser.add_argument("--bulk-publish", action="store_true", help="記事の作成を /batch/v1 でまとめて送る")
+    parser.add_argument("--publish-batch-wait", type=float, default=5.0, help="一括投稿で次の記事を待つ最大秒数")
+    parser.add_argument("--no-wp-batch", action="store_true", help="WordPressスタンドインの /batch/v1 を無効にする")
+    parser.add_argument("--no-wp-batch-posts", action="store_true",
+                        help="WordPressスタンドインで /posts の一括処理を許可しない（rest_batch_not_allowed を返す）")
+    parser.add_argument("--cache", action="store_true", help="生成結果のディスクキャッシュを有効にする")
+    parser.add_argument("--no-stream", action="store_true", help="本文をストリーミングせずに生成する")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Pythonヒープのピーク計測を省略する（計測の負荷をなくす）")
+    parser.add_argument("--json", help="結果をJSONで書き出すファイル")
+    args = parser.parse_args()
+
+    width, height = (int(value) for value in args.image_size.split("x"))
+    gemini = start_fake_gemini(latency=args.gemini_latency, chunks=args.stream_chunks, chunk_interval=args.chunk_interval,
+                               article_chars=args.article_chars, error_rate=args.error_rate)
+    openai_server = start_fake_openai(latency=args.image_latency, download_latency=args.download_latency,
+                                      image_size=(width, height), error_rate=args.error_rate)
+    wordpress = start_fake_wordpress(latency=args.wp_latency, handshake_latency=args.handshake_latency, error_rate=args.error_rate,
+                                     batch=not args.no_wp_batch, batch_posts=not args.no_wp_batch_posts)
+    cache_dir = tempfile.mkdtemp(prefix="trendcom-bench-")
+    report = []
+    try:
+        secrets = build_secrets(args, gemini, openai_server, wordpress, cache_dir)
+        for rows in args.rows:
+            report.append(run_batch(secrets, rows, track_memory=not args.no_tracemalloc))
+            print(f"{rows} rows: {report[-1]['seconds']:.2f}s", file=sys.stderr, flush=True)
+    finally:
+        for server in (gemini, openai_server, wordpress):
+            server.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print_report(report)
+    print(f"requests: gemini={gemini.state.requests} images={openai_server.state.generations} "
+          f"wordpress={wordpress.state.requests} (batched={wordpress.state.batched}) connections={wordpress.state.connections}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""WordPress投稿処理の接続再利用による効果を計測する。
+
+ローカルのスタンドインサーバーに対して、1記事分の投稿処理（挿絵6枚のアップロード、
+カテゴリー取得、記事作成）を、従来の ``requests.post`` 直呼びと ``WordPressClient``
+のそれぞれで実行し、所要時間と張られたTCP接続数を比較する。
+
+    python benchmarks/bench_wordpress.py --articles 20 --handshake-latency 0.15
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_wordpress import start_fake_wordpress  # noqa: E402
+from wordpress import CategoryIndex, WordPressClient  # noqa: E402
+
+IMAGE_BYTES = b"\x89PNG\r\n\x1a\n" + os.urandom(512 * 1024)
+
+
+def post_article_without_session(api_url, index):
+    token = base64.b64encode(b"user:pass")
+    headers = {'Authorization': f'Basic {token.decode("utf-8")}'}
+    for i in range(6):
+        files = {'file': (f"sashie-{i+1}.png", IMAGE_BYTES, "image/png")}
+        requests.post(f"{api_url}/media", headers=headers, files=files, data={'alt_text': f"挿絵{i+1}"})
+    requests.get(f"{api_url}/categories", headers=headers, params={'per_page': 100})
+    requests.post(f"{api_url}/posts", headers=headers, json={'title': f"記事{index}", 'status': 'draft'})
+
+
+def post_article_with_client(client, categories, index):
+    for i in range(6):
+        client.upload_media(IMAGE_BYTES, f"sashie-{i+1}.png", f"挿絵{i+1}")
+    categories.get_or_create("美容")
+    client.create_post({'title': f"記事{index}", 'status': 'draft'})
+
+
+def measure(label, server, run):
+    state = server.state
+    connections, requests_before = state.connections, state.requests
+    started = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<20} {elapsed:8.2f}s  connections={state.connections - connections:<4} requests={state.requests - requests_before}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--articles", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--handshake-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    server = start_fake_wordpress(latency=args.latency, handshake_latency=args.handshake_latency)
+    try:
+        baseline = measure("requests (no session)", server, lambda: [
+            post_article_without_session(server.api_url, i) for i in range(args.articles)
+        ])
+        client = WordPressClient(server.api_url, "user", "pass")
+        categories = CategoryIndex(client)
+        try:
+            pooled = measure("WordPressClient", server, lambda: [
+                post_article_with_client(client, categories, i) for i in range(args.articles)
+            ])
+        finally:
+            client.close()
+        print(f"speedup: {baseline / pooled:.2f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
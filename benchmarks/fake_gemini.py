@@ -0,0 +1,152 @@
+"""ベンチマーク用のローカルGemini APIスタンドイン。
+
+``models/{model}:generateContent`` と ``models/{model}:streamGenerateContent``（SSE）だけを
+実装する。応答の前に ``latency`` 秒待ち、ストリーミングでは本文を ``chunks`` 個に分けて
+``chunk_interval`` 秒ずつ間隔をあけて返す。本文は ``<h3>`` 見出しを含む約 ``article_chars``
+文字のHTMLで、JSON出力を求められた場合はタイトル・スラッグ・カテゴリーのJSONを返す。
+``error_rate`` の割合のリクエストには ``error_status``（既定は503）を返す。
+
+    python benchmarks/fake_gemini.py --port 8081 --latency 0.5
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+ERROR_BODIES = {
+    429: {"code": 429, "message": "Resource has been exhausted (e.g. check quota).", "status": "RESOURCE_EXHAUSTED"},
+    500: {"code": 500, "message": "Internal error encountered.", "status": "INTERNAL"},
+    503: {"code": 503, "message": "The model is overloaded. Please try again later.", "status": "UNAVAILABLE"},
+}
+
+
+class FakeGeminiState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.prompt_chars = 0
+
+
+def fake_article(chars):
+    sections = []
+    index = 0
+    while sum(len(section) for section in sections) < chars:
+        index += 1
+        sections.append(f"<h3>見出し{index}</h3>\n<p>{'本文のダミーテキストです。' * 20}</p>\n")
+    return "```html\n" + "".join(sections) + "{アフィリエイト}\n```"
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _response(self, text, prompt, finish=True):
+        server = self.server
+        candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+        if finish:
+            candidate["finishReason"] = "STOP"
+        payload = {"candidates": [candidate], "modelVersion": "fake"}
+        if finish:
+            payload["usageMetadata"] = {
+                "promptTokenCount": len(prompt) // 2,
+                "candidatesTokenCount": len(text) // 2,
+                "thoughtsTokenCount": server.thinking_tokens,
+                "totalTokenCount": len(prompt) // 2 + len(text) // 2 + server.thinking_tokens,
+            }
+        return payload
+
+    def do_POST(self):
+        server = self.server
+        state = server.state
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        path = urlparse(self.path).path
+        prompt = "".join(
+            part.get("text", "") for content in request.get("contents", []) for part in content.get("parts", [])
+        )
+        with state.lock:
+            state.requests += 1
+            state.prompt_chars += len(prompt)
+        time.sleep(server.latency)
+
+        if random.random() < server.error_rate:
+            with state.lock:
+                state.errors += 1
+            return self._send_json({"error": ERROR_BODIES.get(server.error_status, ERROR_BODIES[503])}, status=server.error_status)
+
+        if request.get("generationConfig", {}).get("responseMimeType") == "application/json":
+            text = json.dumps({"title": "ダミーの記事タイトル", "slug": "dummy-article", "category": "美容"}, ensure_ascii=False)
+        else:
+            text = fake_article(server.article_chars)
+
+        if path.endswith(":generateContent"):
+            return self._send_json(self._response(text, prompt))
+        if not path.endswith(":streamGenerateContent"):
+            return self._send_json({"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}}, status=404)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        size = max(1, -(-len(text) // server.chunks))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(server.chunk_interval)
+            payload = self._response(piece, prompt, finish=i == len(pieces) - 1)
+            event = f"data: {json.dumps(payload, ensure_ascii=False)}\r\n\r\n".encode("utf-8")
+            self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_fake_gemini(host="127.0.0.1", port=0, latency=0.0, chunks=10, chunk_interval=0.0, article_chars=6000,
+                      thinking_tokens=0, error_rate=0.0, error_status=503):
+    server = ThreadingHTTPServer((host, port), FakeGeminiHandler)
+    server.daemon_threads = True
+    server.state = FakeGeminiState()
+    server.latency = latency
+    server.chunks = max(1, chunks)
+    server.chunk_interval = chunk_interval
+    server.article_chars = article_chars
+    server.thinking_tokens = thinking_tokens
+    server.error_rate = error_rate
+    server.error_status = error_status
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--chunks", type=int, default=10)
+    parser.add_argument("--chunk-interval", type=float, default=0.0)
+    parser.add_argument("--article-chars", type=int, default=6000)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503, choices=sorted(ERROR_BODIES))
+    args = parser.parse_args()
+    server = start_fake_gemini(args.host, args.port, args.latency, args.chunks, args.chunk_interval, args.article_chars,
+                               error_rate=args.error_rate, error_status=args.error_status)
+    print(f"Fake Gemini API: {server.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
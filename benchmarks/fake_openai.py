@@ -0,0 +1,122 @@
+"""ベンチマーク用のローカルOpenAI画像生成APIスタンドイン。
+
+``POST /v1/images/generations`` は ``latency`` 秒待ってから、同じサーバー上のPNGの
+URLを返す。PNGは ``image_size``（既定は1792x1024のノイズ画像）で起動時に一度だけ作り、
+``download_latency`` 秒待ってから ``chunk_size`` バイトずつ送る。``error_rate`` の割合の
+生成リクエストには ``error_status``（既定は500）を返す。
+
+    python benchmarks/fake_openai.py --port 8082 --latency 1.0
+"""
+import argparse
+import io
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+
+def noise_png(width, height):
+    # ノイズ画像はほとんど圧縮されないので、実際のDALL-E出力に近いファイルサイズになる
+    output = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert("RGB").save(output, format="PNG")
+    return output.getvalue()
+
+
+class FakeOpenAIState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.generations = 0
+        self.downloads = 0
+        self.errors = 0
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        state = server.state
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.rstrip("/") != "/v1/images/generations":
+            return self._send_json({"error": {"message": "not found", "type": "invalid_request_error"}}, status=404)
+        with state.lock:
+            state.generations += 1
+            image_id = next(state.ids)
+        time.sleep(server.latency)
+        if random.random() < server.error_rate:
+            with state.lock:
+                state.errors += 1
+            return self._send_json({"error": {"message": "fake error", "type": "server_error"}}, status=server.error_status)
+        self._send_json({
+            "created": int(time.time()),
+            "data": [{"url": f"{server.base_url}/files/{image_id}.png", "revised_prompt": ""}],
+        })
+
+    def do_GET(self):
+        server = self.server
+        if not self.path.startswith("/files/"):
+            return self._send_json({"error": {"message": "not found"}}, status=404)
+        with server.state.lock:
+            server.state.downloads += 1
+        time.sleep(server.download_latency)
+        body = server.png
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for offset in range(0, len(body), server.chunk_size):
+            self.wfile.write(body[offset:offset + server.chunk_size])
+
+
+def start_fake_openai(host="127.0.0.1", port=0, latency=0.0, download_latency=0.0, image_size=(1792, 1024),
+                      chunk_size=64 * 1024, error_rate=0.0, error_status=500):
+    server = ThreadingHTTPServer((host, port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.state = FakeOpenAIState()
+    server.latency = latency
+    server.download_latency = download_latency
+    server.png = noise_png(*image_size)
+    server.chunk_size = chunk_size
+    server.error_rate = error_rate
+    server.error_status = error_status
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    server.api_url = f"{server.base_url}/v1"
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--download-latency", type=float, default=0.0)
+    parser.add_argument("--image-size", default="1792x1024")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    width, height = (int(value) for value in args.image_size.split("x"))
+    server = start_fake_openai(args.host, args.port, args.latency, args.download_latency, (width, height),
+                               error_rate=args.error_rate)
+    print(f"Fake OpenAI API: {server.api_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
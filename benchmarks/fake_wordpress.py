@@ -0,0 +1,213 @@
+"""ベンチマーク用のローカルWordPress REST APIスタンドイン。
+
+``/media`` ``/categories`` ``/posts`` と ``/batch/v1``（``batch=False`` で無効）だけを
+実装する。``batch_posts=False`` なら ``/batch/v1`` はあっても ``/posts`` の一括処理を
+許可しないサイト（リクエストごとに ``rest_batch_not_allowed``）を再現する。新しいTCP接続ごとに
+``handshake_latency`` 秒、リクエストごとに ``latency`` 秒待つことで、リモートの
+WordPressホストでのTCP+TLSハンドシェイクと処理時間を再現する。``error_rate`` の
+割合のリクエストには503を返す。
+
+    python benchmarks/fake_wordpress.py --port 8080 --handshake-latency 0.15
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = "/wp-json/wp/v2"
+BATCH_PATH = "/wp-json/batch/v1"
+
+
+class FakeWordPressState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.categories = [{"id": next(self.ids), "name": "美容"}]
+        self.media = {}
+        self.posts = {}
+        self.connections = 0
+        self.requests = 0
+        self.batched = 0
+        self.errors = 0
+
+
+class FakeWordPressHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        server = self.server
+        with server.state.lock:
+            server.state.connections += 1
+        time.sleep(server.handshake_latency)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(chunks)
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        parsed = urlparse(self.path)
+        if not parsed.path.startswith(API_PREFIX):
+            return None, {}
+        query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        return parsed.path[len(API_PREFIX):].rstrip("/"), query
+
+    def _begin(self):
+        # 障害を注入した場合は503を返して False を返す
+        state = self.server.state
+        with state.lock:
+            state.requests += 1
+        time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:
+            with state.lock:
+                state.errors += 1
+            self._send_json({"code": "service_unavailable"}, status=503, headers={"Retry-After": "0"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._begin():
+            return
+        route, query = self._route()
+        if route == "/categories":
+            per_page = int(query.get("per_page", 10))
+            page = int(query.get("page", 1))
+            with self.server.state.lock:
+                categories = list(self.server.state.categories)
+            total_pages = max(1, -(-len(categories) // per_page))
+            if page > total_pages:
+                return self._send_json({"code": "rest_post_invalid_page_number"}, status=400)
+            items = categories[(page - 1) * per_page: page * per_page]
+            return self._send_json(items, headers={"X-WP-Total": str(len(categories)), "X-WP-TotalPages": str(total_pages)})
+        if route == "/posts":
+            statuses = query.get("status", "publish").split(",")
+            with self.server.state.lock:
+                posts = [{"id": post_id, **post} for post_id, post in self.server.state.posts.items()
+                         if post.get("slug") == query.get("slug", post.get("slug")) and post.get("status", "publish") in statuses]
+            return self._send_json(posts)
+        match = re.fullmatch(r"/media/(\d+)", route or "")
+        if match:
+            with self.server.state.lock:
+                exists = int(match.group(1)) in self.server.state.media
+            if exists:
+                return self._send_json({"id": int(match.group(1))})
+            return self._send_json({"code": "rest_post_invalid_id"}, status=404)
+        self._send_json({"code": "rest_no_route"}, status=404)
+
+    def _write_post(self, route, payload):
+        # /posts と /posts/<id> の処理。/batch/v1 からも使う
+        state = self.server.state
+        if route == "/posts":
+            with state.lock:
+                post_id = next(state.ids)
+                state.posts[post_id] = payload
+            return 201, {"id": post_id, **payload}
+        match = re.fullmatch(r"/posts/(\d+)", route or "")
+        if match:
+            with state.lock:
+                post = state.posts.setdefault(int(match.group(1)), {})
+                post.update(payload)
+            return 200, {"id": int(match.group(1)), **post}
+        return 404, {"code": "rest_no_route"}
+
+    def _batch(self, payload):
+        requests = payload.get("requests", [])
+        if len(requests) > 25:
+            return self._send_json({"code": "rest_batch_max_size"}, status=400)
+        with self.server.state.lock:
+            self.server.state.batched += len(requests)
+        responses = []
+        for request in requests:
+            if not self.server.batch_posts:
+                responses.append({"status": 400, "headers": {}, "body": {
+                    "code": "rest_batch_not_allowed",
+                    "message": "The requested route does not support batch requests.",
+                    "data": {"status": 400},
+                }})
+                continue
+            route = request["path"][len("/wp/v2"):] if request["path"].startswith("/wp/v2") else None
+            status, body = self._write_post(route, request.get("body") or {})
+            responses.append({"status": status, "body": body, "headers": {}})
+        self._send_json({"responses": responses}, status=207)
+
+    def do_POST(self):
+        body = self._read_body()
+        if not self._begin():
+            return
+        if self.server.batch and urlparse(self.path).path.rstrip("/") == BATCH_PATH:
+            return self._batch(json.loads(body or b"{}"))
+        route, query = self._route()
+        state = self.server.state
+        if route == "/media":
+            with state.lock:
+                media_id = next(state.ids)
+                state.media[media_id] = {"size": len(body), "alt_text": query.get("alt_text", "")}
+            return self._send_json({"id": media_id, "source_url": f"http://{self.headers.get('Host')}/uploads/{media_id}.png"}, status=201)
+        if route == "/categories":
+            payload = json.loads(body or b"{}")
+            with state.lock:
+                category = {"id": next(state.ids), "name": payload.get("name", "")}
+                state.categories.append(category)
+            return self._send_json(category, status=201)
+        status, payload = self._write_post(route, json.loads(body or b"{}"))
+        self._send_json(payload, status=status)
+
+
+def start_fake_wordpress(host="127.0.0.1", port=0, latency=0.0, handshake_latency=0.0, error_rate=0.0, batch=True, batch_posts=True):
+    server = ThreadingHTTPServer((host, port), FakeWordPressHandler)
+    server.daemon_threads = True
+    server.state = FakeWordPressState()
+    server.latency = latency
+    server.handshake_latency = handshake_latency
+    server.error_rate = error_rate
+    server.batch = batch
+    server.batch_posts = batch_posts
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.api_url = f"http://{host}:{server.server_address[1]}{API_PREFIX}"
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--handshake-latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-batch", action="store_true", help="/batch/v1 に対応していないサイトを再現する")
+    parser.add_argument("--no-batch-posts", action="store_true", help="/posts の一括処理を許可しないサイトを再現する")
+    args = parser.parse_args()
+    server = start_fake_wordpress(args.host, args.port, args.latency, args.handshake_latency, args.error_rate,
+                                  batch=not args.no_batch, batch_posts=not args.no_batch_posts)
+    print(f"Fake WordPress REST API: {server.api_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "content")
+DEFAULT_MAX_SIZE_MB = 2048
+
+
+class ContentCache:
+    """(ステージ, モデル, プロンプト) のハッシュをキーにしたディスクキャッシュ。
+
+    本体はキーごとのファイルに保存し、サイズと最終アクセス時刻をSQLiteの索引で
+    管理する。合計サイズが ``max_bytes`` を超えたら古く使われたものから削除する。
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_SIZE_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER NOT NULL, accessed REAL NOT NULL)")
+        self._db.commit()
+
+    @classmethod
+    def from_secrets(cls, secrets):
+        section = secrets.get("cache", {})
+        if not section.get("enabled", True):
+            return None
+        return cls(
+            section.get("directory", DEFAULT_CACHE_DIR),
+            max_bytes=int(float(section.get("max_size_mb", DEFAULT_MAX_SIZE_MB)) * 1024 * 1024),
+        )
+
+    @staticmethod
+    def make_key(stage, model, prompt, *extra):
+        payload = json.dumps([stage, model, prompt, *extra], ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            os.replace(tmp_path, path)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, size, accessed) VALUES (?, ?, ?)",
+                (key, len(data), time.time()),
+            )
+            self._evict()
+            self._db.commit()
+
+    def delete(self, key):
+        with self._lock:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+    def get_text(self, key):
+        data = self.get(key)
+        return None if data is None else data.decode("utf-8")
+
+    def put_text(self, key, text):
+        self.put(key, text.encode("utf-8"))
+
+    def get_json(self, key):
+        text = self.get_text(key)
+        return None if text is None else json.loads(text)
+
+    def put_json(self, key, value):
+        self.put_text(key, json.dumps(value, ensure_ascii=False))
+
+    def total_size(self):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
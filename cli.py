@@ -0,0 +1,112 @@
+"""CSVから記事を一括生成してWordPressに投稿するコマンドラインツール。
+
+Streamlitアプリと同じCSV形式（1列目: キーワード, 2列目: アフィリエイトHTML）と
+secrets.tomlを使い、1記事ごとに結果をJSONLで書き出す。
+
+    python cli.py keywords.csv --secrets .streamlit/secrets.toml --output results.jsonl
+"""
+import argparse
+import datetime
+import json
+import sys
+import time
+import tomllib
+from concurrent.futures import as_completed
+
+from cache import ContentCache
+from ingest import ArticleCsvReader
+from metrics import pricing_from_secrets, records_to_csv, records_to_json, summarize_articles
+from pipeline import STATUS_LABELS, runner_factory_from_secrets
+from wordpress import WordPressClient
+
+
+def load_secrets(path):
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def print_progress(event, total):
+    label = STATUS_LABELS.get(event["status"], event["status"])
+    message = f" {event['message']}" if event.get("message") else ""
+    if "article_chunk" not in event and "metric" not in event:
+        print(f"[{event['index'] + 1}/{total}] {label}{message}", file=sys.stderr, flush=True)
+
+
+def result_record(result):
+    return {
+        "row": result.index + 1,
+        "main_keyword": result.main_keyword,
+        "title": result.title,
+        "status": result.status,
+        "success": result.status == "成功",
+        "finished_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="CSVから記事を生成してWordPressに投稿します。")
+    parser.add_argument("csv", help="キーワードCSVファイル")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml", help="secrets.tomlのパス")
+    parser.add_argument("--output", default="results.jsonl", help="結果を書き出すJSONLファイル")
+    parser.add_argument("--start-date", type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help="予約投稿の開始日 (YYYY-MM-DD)。行ごとに1日ずつずらす")
+    parser.add_argument("--append", action="store_true", help="結果ファイルを上書きせずに追記する")
+    parser.add_argument("--no-cache", action="store_true", help="生成結果のディスクキャッシュを使わない")
+    parser.add_argument("--quiet", action="store_true", help="進捗を表示しない")
+    parser.add_argument("--metrics", help="ステージごとの所要時間・トークン数・推定コストを書き出すファイル（.csv または .json）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    secrets = load_secrets(args.secrets)
+    with open(args.csv, encoding="utf-8-sig", errors="replace", newline="") as f:
+        reader = ArticleCsvReader(f)
+        articles = list(reader)
+    for error in reader.errors:
+        print(f"CSV {error['line']}行目: {error['message']}", file=sys.stderr)
+    if reader.errors:
+        print(reader.summary(), file=sys.stderr)
+    if not articles:
+        print("CSVファイルが空か、内容が不正です。", file=sys.stderr)
+        return 2
+
+    total = len(articles)
+    metric_records = []
+
+    def on_progress(event):
+        if "metric" in event:
+            metric_records.append(event["metric"])
+        elif not args.quiet:
+            print_progress(event, total)
+
+    wp_client = WordPressClient.from_secrets(secrets)
+    cache = None if args.no_cache else ContentCache.from_secrets(secrets)
+    runner_factory = runner_factory_from_secrets(secrets, wp_client=wp_client, cache=cache)
+
+    started = time.perf_counter()
+    succeeded = 0
+    try:
+        with open(args.output, "a" if args.append else "w", encoding="utf-8") as out, runner_factory(on_progress=on_progress) as runner:
+            for future in as_completed(runner.submit(articles, args.start_date)):
+                record = result_record(future.result())
+                succeeded += record["success"]
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+    finally:
+        wp_client.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"{succeeded}/{total} 件成功 ({elapsed:.1f}秒) -> {args.output}", file=sys.stderr)
+    if args.metrics:
+        pricing = pricing_from_secrets(secrets)
+        export = records_to_json if args.metrics.endswith(".json") else records_to_csv
+        with open(args.metrics, "w", encoding="utf-8", newline="") as f:
+            f.write(export(metric_records, pricing))
+        cost = sum(article["cost_usd"] for article in summarize_articles(metric_records, pricing))
+        print(f"推定コスト: ${cost:.4f} (1記事あたり ${cost / total:.4f}) -> {args.metrics}", file=sys.stderr)
+    return 0 if succeeded == total else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+import functools
+import itertools
+import queue
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+
+from rate_limit import estimate_tokens
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+
+@dataclass(frozen=True)
+class StageModel:
+    model: str = DEFAULT_MODEL
+    # -1: 動的な思考予算 / 0: 思考なし
+    thinking_budget: int = -1
+    # Google検索によるグラウンディングを使うか
+    grounding: bool = False
+
+
+# 検索グラウンディングは最新情報が必要な構成案と本文だけで使う
+DEFAULT_STAGE_MODELS = {
+    "outline": StageModel(grounding=True),
+    "article": StageModel(grounding=True),
+    "image_prompt": StageModel(),
+    "metadata": StageModel(),
+    "title": StageModel(),
+    "slug": StageModel(thinking_budget=0),
+    "category": StageModel(thinking_budget=0),
+}
+
+
+def stage_models_from_secrets(secrets):
+    """``[gemini.stages.<stage>]`` の model / thinking_budget / grounding で既定値を上書きする。"""
+    section = secrets.get("gemini", {}).get("stages", {})
+    stage_models = dict(DEFAULT_STAGE_MODELS)
+    for stage, overrides in section.items():
+        base = stage_models.get(stage, StageModel())
+        stage_models[stage] = StageModel(
+            model=overrides.get("model", base.model),
+            thinking_budget=int(overrides.get("thinking_budget", base.thinking_budget)),
+            grounding=bool(overrides.get("grounding", base.grounding)),
+        )
+    return stage_models
+
+
+# SDKの既定ではHTTPの読み取りにタイムアウトがなく、応答の止まった接続を待ち続ける
+DEFAULT_REQUEST_TIMEOUT = 600.0
+
+
+class StreamStalled(Exception):
+    pass
+
+
+class GeminiRegistry:
+    """プロセス全体で共有するGeminiクライアントと、ステージごとの生成設定。"""
+
+    def __init__(self, api_key, stage_models=None, base_url=None, timeout=DEFAULT_REQUEST_TIMEOUT):
+        # SDKの読み込みは重いので、アプリの起動時ではなく最初にクライアントを作るときに行う
+        from google import genai
+        from google.genai import types
+
+        # base_url を指定するとプロキシやベンチマーク用のスタンドインサーバーに接続する。
+        # timeout（秒）は読み取りの待ち時間の上限で、停止したストリームを読むスレッドもこの時間で終わる
+        http_options = types.HttpOptions(base_url=base_url, timeout=int(timeout * 1000) if timeout else None)
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+        self.stage_models = dict(stage_models or DEFAULT_STAGE_MODELS)
+        self._configs = {}
+        self._lock = threading.Lock()
+
+    def stage_model(self, stage):
+        return self.stage_models.get(stage, StageModel())
+
+    def config_for(self, stage, **overrides):
+        if overrides:
+            return self._build_config(self.stage_model(stage), **overrides)
+        with self._lock:
+            if stage not in self._configs:
+                self._configs[stage] = self._build_config(self.stage_model(stage))
+            return self._configs[stage]
+
+    @staticmethod
+    def _build_config(stage_model, **overrides):
+        from google.genai import types
+
+        tools = [types.Tool(googleSearch=types.GoogleSearch())] if stage_model.grounding else None
+        return types.GenerateContentConfig(
+            thinking_config=types.ThinkingConfig(thinking_budget=stage_model.thinking_budget),
+            tools=tools,
+            **overrides
+        )
+
+    def generate(self, stage, prompt, on_usage=None, **config_overrides):
+        from google.genai import types
+
+        response = self.client.models.generate_content(
+            model=self.stage_model(stage).model,
+            contents=[types.Content(
+                role="user",
+                parts=[types.Part.from_text(text=prompt)]
+            )],
+            config=self.config_for(stage, **config_overrides)
+        )
+        if on_usage and response.usage_metadata:
+            on_usage(response.usage_metadata)
+        return response.text
+
+    def _stream_chunks(self, stage, prompt, first_chunk_timeout, stall_timeout, config_overrides, usage):
+        # ストリームは別スレッドで読み、チャンク間の待ち時間が閾値を超えたら打ち切る
+        chunks = queue.Queue()
+        cancelled = threading.Event()
+        finished = object()
+
+        from google.genai import types
+
+        def pump():
+            try:
+                stream = self.client.models.generate_content_stream(
+                    model=self.stage_model(stage).model,
+                    contents=[types.Content(
+                        role="user",
+                        parts=[types.Part.from_text(text=prompt)]
+                    )],
+                    config=self.config_for(stage, **config_overrides)
+                )
+                # 打ち切られた場合もストリームを閉じて、プールの接続を返す
+                with closing(stream):
+                    for chunk in stream:
+                        if cancelled.is_set():
+                            return
+                        if chunk.usage_metadata:
+                            # 使用トークン数は最後のチャンクの値が全体の合計になる
+                            usage["value"] = chunk.usage_metadata
+                        chunks.put(chunk.text or "")
+                chunks.put(finished)
+            except Exception as e:
+                chunks.put(e)
+
+        threading.Thread(target=pump, name=f"gemini-stream-{stage}", daemon=True).start()
+        timeout = first_chunk_timeout
+        while True:
+            try:
+                item = chunks.get(timeout=timeout)
+            except queue.Empty:
+                cancelled.set()
+                raise StreamStalled(f"Geminiの応答が{timeout:.0f}秒間途絶えました。")
+            if item is finished:
+                return
+            if isinstance(item, Exception):
+                raise item
+            timeout = stall_timeout
+            if item:
+                yield item
+
+    def generate_stream(self, stage, prompt, on_chunk=None, first_chunk_timeout=180.0, stall_timeout=30.0,
+                        retries=1, on_usage=None, **config_overrides):
+        """ストリーミングで生成し、チャンクごとに ``on_chunk(chunk, attempt)`` を呼ぶ。
+
+        最初のチャンクまで ``first_chunk_timeout`` 秒、以降はチャンク間で ``stall_timeout``
+        秒応答がなければ停止とみなし、``retries`` 回まで最初からやり直す。
+        完了すると ``on_usage(usage_metadata)`` でトークン数を通知する。
+        """
+        for attempt in range(retries + 1):
+            parts = []
+            usage = {}
+            try:
+                for chunk in self._stream_chunks(stage, prompt, first_chunk_timeout, stall_timeout, config_overrides, usage):
+                    parts.append(chunk)
+                    if on_chunk:
+                        on_chunk(chunk, attempt)
+            except StreamStalled:
+                if attempt >= retries:
+                    raise
+                continue
+            if on_usage and usage.get("value"):
+                on_usage(usage["value"])
+            return "".join(parts)
+
+
+class RateLimitedGemini:
+    """``GeminiRegistry`` の呼び出しをモデルごとのRPM/TPM制限に通し、一時的なエラーは再試行する。
+
+    ``limiters`` は ``rate_limit.RateLimiterRegistry``、``retry_policy`` は ``rate_limit.RetryPolicy``。
+    再試行のたびに ``on_retry(attempt, delay, error)`` を呼ぶ。``on_call`` を渡すと、成功した
+    呼び出しごとに所要時間・再試行回数・トークン数をdictで受け取れる。
+    """
+
+    def __init__(self, registry, limiters, retry_policy, on_retry=None, on_call=None):
+        self.registry = registry
+        self.limiters = limiters
+        self.retry_policy = retry_policy
+        self.on_retry = on_retry
+        self.on_call = on_call
+
+    def stage_model(self, stage):
+        return self.registry.stage_model(stage)
+
+    def _call(self, stage, prompt, fn):
+        model = self.stage_model(stage).model
+        limiter = self.limiters.get("gemini", model)
+        retries = []
+        usage = {}
+
+        def on_retry(attempt, delay, error):
+            retries.append(attempt)
+            if self.on_retry:
+                self.on_retry(attempt, delay, error)
+
+        def on_usage(metadata):
+            usage["value"] = metadata
+
+        # PromptRegistry で描画したプロンプトは見積もり済みなので、本文を数え直さない
+        prompt_tokens = getattr(prompt, "estimated_tokens", None)
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(prompt)
+        started = time.perf_counter()
+        text = self.retry_policy.call(lambda: fn(on_usage), limiter=limiter, tokens=prompt_tokens, on_retry=on_retry)
+        if self.on_call:
+            metadata = usage.get("value")
+            self.on_call({
+                "call": f"gemini:{stage}",
+                "model": model,
+                "seconds": time.perf_counter() - started,
+                "retries": len(retries),
+                "prompt_tokens_est": prompt_tokens,
+                "input_tokens": (metadata and metadata.prompt_token_count) or 0,
+                "output_tokens": (metadata and metadata.candidates_token_count) or 0,
+                "thinking_tokens": (metadata and metadata.thoughts_token_count) or 0,
+            })
+        return text
+
+    def generate(self, stage, prompt, **config_overrides):
+        return self._call(stage, prompt, lambda on_usage: self.registry.generate(stage, prompt, on_usage=on_usage, **config_overrides))
+
+    def generate_stream(self, stage, prompt, on_chunk=None, first_chunk_timeout=180.0, stall_timeout=30.0,
+                        retries=1, **config_overrides):
+        # 応答の途絶は registry 側で再試行済みなので、ここではAPIエラーだけをやり直す。
+        # やり直した分は attempt を進めて、プレビューが途中までの本文を捨てられるようにする
+        calls = itertools.count()
+
+        def stream(on_usage):
+            base = next(calls) * (retries + 1)
+            return self.registry.generate_stream(
+                stage, prompt, on_chunk=(lambda chunk, attempt: on_chunk(chunk, base + attempt)) if on_chunk else None,
+                first_chunk_timeout=first_chunk_timeout, stall_timeout=stall_timeout, retries=retries, on_usage=on_usage,
+                **config_overrides
+            )
+
+        return self._call(stage, prompt, stream)
+
+
+class CachedGemini:
+    """``GeminiRegistry`` と同じ呼び出し方で、結果を ``ContentCache`` に保存・再利用する。"""
+
+    def __init__(self, registry, cache):
+        self.registry = registry
+        self.cache = cache
+
+    def stage_model(self, stage):
+        return self.registry.stage_model(stage)
+
+    def _key(self, stage, prompt, config_overrides):
+        return self.cache.make_key(stage, self.stage_model(stage).model, prompt, sorted(config_overrides.items()))
+
+    def generate(self, stage, prompt, **config_overrides):
+        key = self._key(stage, prompt, config_overrides)
+        text = self.cache.get_text(key)
+        if text is None:
+            text = self.registry.generate(stage, prompt, **config_overrides)
+            if text:
+                self.cache.put_text(key, text)
+        return text
+
+    def generate_stream(self, stage, prompt, on_chunk=None, first_chunk_timeout=180.0, stall_timeout=30.0,
+                        retries=1, **config_overrides):
+        key = self._key(stage, prompt, config_overrides)
+        text = self.cache.get_text(key)
+        if text is not None:
+            if on_chunk:
+                on_chunk(text, 0)
+            return text
+        text = self.registry.generate_stream(
+            stage, prompt, on_chunk=on_chunk, first_chunk_timeout=first_chunk_timeout,
+            stall_timeout=stall_timeout, retries=retries, **config_overrides
+        )
+        if text:
+            self.cache.put_text(key, text)
+        return text
+
+
+@functools.lru_cache(maxsize=None)
+def _registry(api_key, stage_items, base_url, timeout):
+    return GeminiRegistry(api_key, dict(stage_items), base_url=base_url, timeout=timeout)
+
+
+def shared_registry(api_key, stage_models=None, base_url=None, timeout=DEFAULT_REQUEST_TIMEOUT):
+    # 同じAPIキーと設定の組み合わせには同じクライアントを返す
+    stage_models = stage_models or DEFAULT_STAGE_MODELS
+    return _registry(api_key, tuple(sorted(stage_models.items())), base_url, timeout)
@@ -0,0 +1,124 @@
+import io
+import os
+import tempfile
+import threading
+
+UPLOAD_FORMATS = {
+    "JPEG": ("image/jpeg", "jpg"),
+    "WEBP": ("image/webp", "webp"),
+}
+
+
+class SpoolWriter:
+    """ダウンロード中の画像をメモリに溜めずに一時ファイルへ書き出す。"""
+
+    def __init__(self, store, mime_type):
+        self.store = store
+        self.mime_type = mime_type
+        self._file = tempfile.NamedTemporaryFile(dir=store.directory, suffix=".img", delete=False)
+        self.size = 0
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._file.name)
+        except FileNotFoundError:
+            pass
+
+    def finish(self):
+        self._file.close()
+        return self.store._handle(self._file.name, self.mime_type, self.size)
+
+
+class ImageAssetStore:
+    """挿絵の本体を一時ファイルに置き、軽量なハンドルだけを受け渡す。
+
+    ハンドルは ``path`` / ``mime_type`` / ``size`` / ``thumbnail``（プレビュー用に縮小した
+    WebPのバイト列）を持つdict。本体はWordPressへの投稿後に ``discard`` で削除する。
+    """
+
+    def __init__(self, directory=None, thumbnail_width=480, thumbnail_quality=70,
+                 upload_format=None, upload_quality=85):
+        self.directory = directory or tempfile.mkdtemp(prefix="trendcom-images-")
+        os.makedirs(self.directory, exist_ok=True)
+        self.thumbnail_width = thumbnail_width
+        self.thumbnail_quality = thumbnail_quality
+        self.upload_format = upload_format.upper() if upload_format else None
+        if self.upload_format and self.upload_format not in UPLOAD_FORMATS:
+            raise ValueError(f"未対応の画像形式です: {upload_format}")
+        self.upload_quality = upload_quality
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_secrets(cls, secrets):
+        section = secrets.get("images", {})
+        return cls(
+            directory=section.get("spool_directory"),
+            thumbnail_width=int(section.get("thumbnail_width", 480)),
+            upload_format=section.get("upload_format") or None,
+            upload_quality=int(section.get("upload_quality", 85)),
+        )
+
+    @property
+    def compresses_uploads(self):
+        return self.upload_format is not None
+
+    def writer(self, mime_type="image/png"):
+        return SpoolWriter(self, mime_type)
+
+    def put(self, data, mime_type="image/png"):
+        writer = self.writer(mime_type)
+        writer.write(data)
+        return writer.finish()
+
+    def _handle(self, path, mime_type, size):
+        return {
+            "path": path,
+            "mime_type": mime_type,
+            "size": size,
+            "thumbnail": self._thumbnail(path),
+        }
+
+    def _thumbnail(self, path):
+        from PIL import Image
+
+        try:
+            with Image.open(path) as image:
+                image.thumbnail((self.thumbnail_width, self.thumbnail_width))
+                output = io.BytesIO()
+                image.save(output, format="WEBP", quality=self.thumbnail_quality)
+                return output.getvalue()
+        except Exception:
+            return None
+
+    def read(self, handle):
+        with open(handle["path"], "rb") as f:
+            return f.read()
+
+    def upload_payload(self, handle):
+        """アップロード用の (本文, MIMEタイプ, 拡張子) を返す。圧縮設定があれば再エンコードする。"""
+        if not self.compresses_uploads:
+            return self.read(handle), handle["mime_type"], handle["mime_type"].split("/")[-1]
+        from PIL import Image
+
+        mime_type, extension = UPLOAD_FORMATS[self.upload_format]
+        with Image.open(handle["path"]) as image:
+            if self.upload_format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            output = io.BytesIO()
+            image.save(output, format=self.upload_format, quality=self.upload_quality, optimize=True)
+        return output.getvalue(), mime_type, extension
+
+    def discard(self, handles):
+        # プレビュー用のサムネイルは残し、本体の一時ファイルだけを削除する
+        for handle in handles:
+            path = handle.pop("path", None)
+            if path:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
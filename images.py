@@ -0,0 +1,134 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import requests
+
+from image_store import ImageAssetStore
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+IMAGE_MODEL = "dall-e-3"
+IMAGE_MIME_TYPE = "image/png"
+
+
+def image_cache_key(cache, dall_e_prompt, index):
+    return cache.make_key("image", IMAGE_MODEL, dall_e_prompt, index)
+
+
+def generate_image_url(openai_client, dall_e_prompt):
+    response = openai_client.images.generate(model=IMAGE_MODEL, prompt=dall_e_prompt, n=1, size="1792x1024", response_format="url")
+    return response.data[0].url
+
+
+class TeeDownload:
+    # ダウンロードしたチャンクをアップロードに流しつつ、一時ファイルにも書き出す
+    def __init__(self, response, writer):
+        self.writer = writer
+        self.complete = False
+        self.chunks = self._iter(response)
+
+    def _iter(self, response):
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            if chunk:
+                self.writer.write(chunk)
+                yield chunk
+        self.complete = True
+
+    def finish(self):
+        # アップロードに失敗しても残りを読み切ってプレビュー用の画像は確保する
+        for _ in self.chunks:
+            pass
+        if not self.complete:
+            raise IOError("画像のダウンロードが途中で中断されました。")
+        return self.writer.finish()
+
+
+def generate_and_upload_images(openai_client, dall_e_prompt, count, upload=None, max_workers=None,
+                               dalle_slot=None, upload_slot=None, warn=None, cache=None, store=None, generate_url=None,
+                               on_metric=None):
+    """挿絵をまとめて生成し、URLが返った画像から順にダウンロード・アップロードする。
+
+    ``upload(index, body, mime_type, extension)`` は ``(media_id, source_url)`` を返す。
+    圧縮設定がなければダウンロード中のチャンクをそのまま渡すため、取得とアップロードは
+    残りの生成処理と重なって進む。戻り値は生成に成功した画像のハンドル
+    （``ImageAssetStore`` 参照）を元の順番で並べたリスト。``cache`` があれば同じ
+    プロンプト・番号の画像は生成とダウンロードを省略する。``generate_url(prompt)`` を渡せば
+    画像URLの取得をレート制限・再試行つきの呼び出しに差し替えられる。``on_metric`` には
+    ダウンロードごとの所要時間とバイト数をdictで渡す（ストリーミング時はアップロード時間を含む）。
+    ストリーミングでのアップロードに失敗した画像は、一時ファイルからContent-Length付きで送り直す。
+    """
+    results = [None] * count
+    store = store or ImageAssetStore()
+    dalle_slot = dalle_slot or nullcontext()
+    upload_slot = upload_slot or nullcontext()
+    generate_url = generate_url or (lambda prompt: generate_image_url(openai_client, prompt))
+    warn_lock = threading.Lock()
+
+    def report(message):
+        if warn:
+            with warn_lock:
+                warn(message)
+
+    def upload_stored(i, handle):
+        if upload is None:
+            return
+        with upload_slot:
+            try:
+                body, mime_type, extension = store.upload_payload(handle)
+                handle['media_id'], handle['source_url'] = upload(i, body, mime_type, extension)
+            except Exception as e:
+                report(f"挿絵 {i+1} のアップロードに失敗: {e}")
+
+    def produce(i):
+        if cache is not None:
+            cached_bytes = cache.get(image_cache_key(cache, dall_e_prompt, i))
+            if cached_bytes is not None:
+                handle = store.put(cached_bytes, IMAGE_MIME_TYPE)
+                upload_stored(i, handle)
+                results[i] = handle
+                return
+
+        try:
+            with dalle_slot:
+                image_url = generate_url(dall_e_prompt)
+        except Exception as e:
+            report(f"挿絵 {i+1} の生成中にエラー: {e}")
+            return
+
+        writer = store.writer(IMAGE_MIME_TYPE)
+        streamed = upload is not None and not store.compresses_uploads
+        media = {}
+        stream_error = None
+        started = time.perf_counter()
+        try:
+            with requests.get(image_url, stream=True, timeout=60) as img_response:
+                img_response.raise_for_status()
+                download = TeeDownload(img_response, writer)
+                if streamed:
+                    with upload_slot:
+                        try:
+                            media['media_id'], media['source_url'] = upload(i, download.chunks, IMAGE_MIME_TYPE, "png")
+                        except Exception as e:
+                            # チャンク転送の本文を受け付けないサーバーもあるので、読み切った後で送り直す
+                            stream_error = e
+                handle = download.finish()
+        except Exception as e:
+            writer.abort()
+            report(f"挿絵 {i+1} の生成中にエラー: {e}")
+            return
+        handle.update(media)
+        if on_metric:
+            on_metric({"call": "image_download", "seconds": time.perf_counter() - started, "bytes": handle["size"]})
+        if stream_error is not None:
+            report(f"挿絵 {i+1} のストリーミングアップロードに失敗したため、まとめて送り直します: {stream_error}")
+        if not streamed or stream_error is not None:
+            upload_stored(i, handle)
+        if cache is not None:
+            cache.put(image_cache_key(cache, dall_e_prompt, i), store.read(handle))
+        results[i] = handle
+
+    workers = max(1, min(count, max_workers or count))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image") as executor:
+        list(executor.map(produce, range(count)))
+    return [handle for handle in results if handle is not None]
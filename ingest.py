@@ -0,0 +1,105 @@
+import csv
+import io
+import unicodedata
+
+MAIN_KEYWORD_LABEL = "メインキーワード:"
+HEADING_KEYWORDS_LABEL = "見出し用キーワードリスト:"
+MAX_MAIN_KEYWORD_LENGTH = 200
+
+
+def parse_keyword_cell(keyword_data):
+    # 「メインキーワード: ... 見出し用キーワードリスト: ...」形式。ラベルがなければ全体をメインキーワードとみなす
+    if MAIN_KEYWORD_LABEL in keyword_data and HEADING_KEYWORDS_LABEL in keyword_data:
+        parts = keyword_data.split(HEADING_KEYWORDS_LABEL)
+        return parts[0].replace(MAIN_KEYWORD_LABEL, "").strip(), parts[1].strip()
+    return keyword_data.strip(), ""
+
+
+def validate_keyword_cell(keyword_data):
+    """キーワード欄の形式を確認し、問題があればエラーメッセージを返す。"""
+    if "\ufffd" in keyword_data:
+        return "文字コードがUTF-8ではありません。"
+    has_main = MAIN_KEYWORD_LABEL in keyword_data
+    has_heading = HEADING_KEYWORDS_LABEL in keyword_data
+    if has_main and not has_heading:
+        return f"「{HEADING_KEYWORDS_LABEL}」がありません。"
+    if has_heading and not has_main:
+        return f"「{MAIN_KEYWORD_LABEL}」がありません。"
+    if has_heading and keyword_data.count(HEADING_KEYWORDS_LABEL) > 1:
+        return f"「{HEADING_KEYWORDS_LABEL}」が複数あります。"
+    main_kw, _ = parse_keyword_cell(keyword_data)
+    if not main_kw:
+        return "メインキーワードが空です。"
+    if len(main_kw) > MAX_MAIN_KEYWORD_LENGTH:
+        return f"メインキーワードが長すぎます（{len(main_kw)}文字）。"
+    return None
+
+
+def normalize_keyword(keyword):
+    # 全角・半角や大文字・小文字、空白の違いだけの重複もまとめる
+    return " ".join(unicodedata.normalize("NFKC", keyword).casefold().split())
+
+
+def decode_stream(binary_stream):
+    """アップロードされたファイルなどのバイナリストリームを、全体を読み込まずに逐次デコードする。"""
+    # 不正なバイト列で全体を失わないよう置換文字にし、該当行だけをエラーとして扱う
+    return io.TextIOWrapper(binary_stream, encoding="utf-8-sig", errors="replace", newline="")
+
+
+class ArticleCsvReader:
+    """CSV（1列目: キーワード, 2列目: アフィリエイトHTML）を1行ずつ検証しながら記事データを返す。
+
+    形式が不正な行と、既出のメインキーワードの行は飛ばして ``errors`` に
+    ``{"line": CSVの行番号, "message": 内容}`` を残す。反復しながら読むので、
+    大きなファイルでも最初の行からすぐに処理を始められる。
+    """
+
+    def __init__(self, text_stream, deduplicate=True):
+        self.text_stream = text_stream
+        self.deduplicate = deduplicate
+        self.errors = []
+        self.accepted = 0
+        self.duplicates = 0
+        self._seen = {}
+
+    def _error(self, line, message):
+        self.errors.append({"line": line, "message": message})
+
+    def __iter__(self):
+        reader = csv.reader(self.text_stream)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                self._error(reader.line_num, f"CSVとして読み込めません: {e}")
+                continue
+            if not row or not row[0].strip(): continue
+            line = reader.line_num
+            message = validate_keyword_cell(row[0])
+            if message:
+                self._error(line, message)
+                continue
+            main_kw, heading_kws = parse_keyword_cell(row[0])
+            if self.deduplicate:
+                key = normalize_keyword(main_kw)
+                if key in self._seen:
+                    self.duplicates += 1
+                    self._error(line, f"メインキーワード「{main_kw}」は{self._seen[key]}行目と重複しているため飛ばしました。")
+                    continue
+                self._seen[key] = line
+            self.accepted += 1
+            yield {
+                "main_keyword": main_kw,
+                "heading_keywords_list": heading_kws,
+                "affiliate_html": row[1] if len(row) > 1 else ""
+            }
+
+    def summary(self):
+        return f"CSVから{self.accepted}件を読み込みました（エラー {len(self.errors) - self.duplicates}件、重複 {self.duplicates}件）。"
+
+
+def read_articles_csv(text_stream):
+    """CSVから検証済みの記事データを順に返す。不正な行と重複行は飛ばす。"""
+    return iter(ArticleCsvReader(text_stream))
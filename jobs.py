@@ -0,0 +1,557 @@
+import base64
+import datetime
+import itertools
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, wait
+
+DEFAULT_JOB_DB = os.path.join(".cache", "jobs.sqlite3")
+
+FINISHED_ROW_STATUSES = ("done", "failed")
+INGEST_BATCH_SIZE = 500
+INGEST_POLL_INTERVAL = 0.2
+# 実行中のジョブはランナーが定期的に更新する期限つきで持つ。期限が切れたジョブだけを別のランナーが引き継ぐ
+JOB_LEASE_SECONDS = 60.0
+HEARTBEAT_INTERVAL = 10.0
+# 生成中の本文のプレビューをDBに書き出す最短間隔（秒）。別プロセスのアプリはDBから読む
+PREVIEW_SAVE_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL,
+    reservation_date TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    ingesting INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    heartbeat_at REAL,
+    ingested_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_rows (
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    row_index INTEGER NOT NULL,
+    main_keyword TEXT NOT NULL,
+    heading_keywords_list TEXT NOT NULL,
+    affiliate_html TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    title TEXT NOT NULL DEFAULT '',
+    result TEXT NOT NULL DEFAULT '',
+    outline TEXT,
+    article TEXT,
+    images TEXT,
+    post TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, row_index)
+);
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    row_index INTEGER,
+    level TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_events_by_job ON job_events (job_id, id);
+CREATE TABLE IF NOT EXISTS job_previews (
+    job_id INTEGER PRIMARY KEY REFERENCES jobs(id),
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    row_index INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class JobStore:
+    """バッチジョブと各行の進捗を保存するSQLiteストア。
+
+    各行には完了したステージの出力（構成案・本文・アップロード済み挿絵・投稿のタイトルとスラッグ）
+    も残すため、プロセスが再起動しても中断した行・ステージから再開できる。
+    """
+
+    def __init__(self, path=DEFAULT_JOB_DB):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        # 取り込み中フラグや実行中ランナーの列がなかった頃のDBにも列を追加する
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for name, definition in (
+            ("ingesting", "INTEGER NOT NULL DEFAULT 0"),
+            ("owner", "TEXT"),
+            ("heartbeat_at", "REAL"),
+            ("ingested_at", "REAL"),
+        ):
+            if name not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+        row_columns = {row["name"] for row in self._db.execute("PRAGMA table_info(job_rows)")}
+        if "post" not in row_columns:
+            self._db.execute("ALTER TABLE job_rows ADD COLUMN post TEXT")
+        self._db.commit()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            self._db.commit()
+            return cursor
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params).fetchall()]
+
+    def create_job(self, articles, reservation_date, ingesting=False):
+        """ジョブを登録する。``ingesting`` なら行は後から ``append_rows`` で追加し、``finish_ingest`` で締める。"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (status, reservation_date, total, ingesting, ingested_at, created_at, updated_at) VALUES ('queued', ?, 0, ?, ?, ?, ?)",
+                (reservation_date.isoformat(), int(ingesting), now, now, now),
+            )
+            job_id = cursor.lastrowid
+            self._db.commit()
+        self.append_rows(job_id, 0, articles)
+        return job_id
+
+    def append_rows(self, job_id, start_index, articles):
+        now = time.time()
+        values = [
+            (job_id, index, article["main_keyword"], article["heading_keywords_list"], article.get("affiliate_html", ""), now)
+            for index, article in enumerate(articles, start_index)
+        ]
+        if not values:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO job_rows (job_id, row_index, main_keyword, heading_keywords_list, affiliate_html, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                values,
+            )
+            self._db.execute(
+                "UPDATE jobs SET total = total + ?, ingested_at = ?, updated_at = ? WHERE id = ?", (len(values), now, now, job_id)
+            )
+            self._db.commit()
+
+    def finish_ingest(self, job_id):
+        self._execute("UPDATE jobs SET ingesting = 0, updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def job(self, job_id):
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    def list_jobs(self, limit=20):
+        return self._query("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+
+    def rows(self, job_id, exclude_statuses=(), limit=-1):
+        placeholders = ", ".join("?" for _ in exclude_statuses)
+        return self._query(
+            "SELECT row_index, main_keyword, status, title, result FROM job_rows WHERE job_id = ?"
+            f"{f' AND status NOT IN ({placeholders})' if exclude_statuses else ''} ORDER BY row_index LIMIT ?",
+            (job_id, *exclude_statuses, limit),
+        )
+
+    def status_counts(self, job_id):
+        rows = self._query("SELECT status, COUNT(*) AS count FROM job_rows WHERE job_id = ? GROUP BY status", (job_id,))
+        return {row["status"]: row["count"] for row in rows}
+
+    def pending_rows(self, job_id, after_index=-1, limit=-1):
+        rows = self._query(
+            "SELECT * FROM job_rows WHERE job_id = ? AND row_index > ? AND status NOT IN (?, ?) ORDER BY row_index LIMIT ?",
+            (job_id, after_index, *FINISHED_ROW_STATUSES, limit),
+        )
+        for row in rows:
+            row["images"] = None if row["images"] is None else json.loads(row["images"])
+            row["post"] = None if row["post"] is None else json.loads(row["post"])
+        return rows
+
+    def events(self, job_id, after_id=0, limit=-1):
+        # limit を指定した場合は最新の limit 件を古い順に返す（大きなCSVのジョブでも全件は読まない）
+        rows = self._query(
+            "SELECT * FROM job_events WHERE job_id = ? AND id > ? ORDER BY id DESC LIMIT ?", (job_id, after_id, limit)
+        )
+        rows.reverse()
+        return rows
+
+    def event_count(self, job_id):
+        return self._query("SELECT COUNT(*) AS count FROM job_events WHERE job_id = ?", (job_id,))[0]["count"]
+
+    def claim_next_job(self, owner):
+        """実行待ちのジョブを1件 ``owner`` のものにして返す。
+
+        同じDBを使う別のプロセスと取り合っても、状態が ``queued`` のままのジョブだけを
+        条件つきのUPDATEで取るので、同じジョブを二重に実行しない。
+        """
+        while True:
+            with self._lock:
+                row = self._db.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                cursor = self._db.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, heartbeat_at = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+                    (owner, now, now, row["id"]),
+                )
+                self._db.commit()
+            if cursor.rowcount:
+                return self.job(row["id"])
+
+    def renew_leases(self, owner):
+        self._execute("UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status = 'running'", (time.time(), owner))
+
+    def requeue_expired(self, lease=JOB_LEASE_SECONDS):
+        """期限内に更新されなかった実行中のジョブを再開待ちに戻し、戻した件数を返す。
+
+        実行中のランナーは ``renew_leases`` で期限を延ばし続けるので、停止したプロセスの
+        ジョブだけが対象になる。CSVの取り込みは再開できないので、取り込みが止まったジョブは
+        登録済みの行だけで続ける。
+        """
+        expired = time.time() - lease
+        with self._lock:
+            stalled = [row["id"] for row in self._db.execute(
+                "SELECT id FROM jobs WHERE ingesting = 1 AND COALESCE(ingested_at, 0) < ?", (expired,)
+            )]
+            now = time.time()
+            for job_id in stalled:
+                self._db.execute(
+                    "INSERT INTO job_events (job_id, row_index, level, message, created_at) VALUES (?, NULL, 'warning', ?, ?)",
+                    (job_id, "CSVの取り込み中に中断されたため、取り込み済みの行だけを処理します。", now),
+                )
+                self._db.execute("UPDATE jobs SET ingesting = 0, updated_at = ? WHERE id = ? AND ingesting = 1", (now, job_id))
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, updated_at = ? WHERE status = 'running' AND COALESCE(heartbeat_at, 0) < ?",
+                (now, expired),
+            )
+            self._db.commit()
+        return cursor.rowcount
+
+    def set_job_status(self, job_id, status, owner=None):
+        # owner を渡した場合は、そのランナーがまだジョブを持っているときだけ更新する
+        if owner is None:
+            self._execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (status, time.time(), job_id))
+        else:
+            self._execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND owner = ?", (status, time.time(), job_id, owner)
+            )
+
+    def update_row(self, job_id, row_index, **fields):
+        for name in ("images", "post"):
+            if name in fields:
+                fields[name] = json.dumps(fields[name], ensure_ascii=False)
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(
+            f"UPDATE job_rows SET {assignments}, updated_at = ? WHERE job_id = ? AND row_index = ?",
+            (*fields.values(), time.time(), job_id, row_index),
+        )
+
+    def add_event(self, job_id, row_index, level, message):
+        self._execute(
+            "INSERT INTO job_events (job_id, row_index, level, message, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, row_index, level, message, time.time()),
+        )
+
+    def add_metric(self, job_id, row_index, metric):
+        self._execute(
+            "INSERT INTO job_metrics (job_id, row_index, data, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, row_index, json.dumps(metric, ensure_ascii=False), time.time()),
+        )
+
+    def save_preview(self, job_id, preview):
+        # 挿絵はプレビュー用の縮小画像だけを残す
+        data = {
+            **{name: value for name, value in preview.items() if name not in ("chunks", "images")},
+            "images": [
+                {"thumbnail": base64.b64encode(image["thumbnail"]).decode("ascii")}
+                for image in preview.get("images") or [] if image.get("thumbnail")
+            ],
+        }
+        self._execute(
+            "INSERT INTO job_previews (job_id, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (job_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (job_id, json.dumps(data, ensure_ascii=False), time.time()),
+        )
+
+    def preview(self, job_id):
+        rows = self._query("SELECT data FROM job_previews WHERE job_id = ?", (job_id,))
+        if not rows:
+            return None
+        preview = json.loads(rows[0]["data"])
+        preview["images"] = [{"thumbnail": base64.b64decode(image["thumbnail"])} for image in preview["images"]]
+        return preview
+
+    def delete_preview(self, job_id):
+        self._execute("DELETE FROM job_previews WHERE job_id = ?", (job_id,))
+
+    def metrics(self, job_id):
+        rows = self._query("SELECT data FROM job_metrics WHERE job_id = ? ORDER BY id", (job_id,))
+        return [json.loads(row["data"]) for row in rows]
+
+
+def job_runner_from_secrets(secrets, runner_factory):
+    """secrets の ``[jobs]`` から JobRunner を作る。スレッドは ``start()`` で開始する。"""
+    section = secrets.get("jobs", {})
+    store = JobStore(section.get("database", DEFAULT_JOB_DB))
+    return JobRunner(store, runner_factory, max_jobs=int(section.get("max_concurrent_jobs", 1)))
+
+
+class JobRunner:
+    """JobStoreのジョブをバックグラウンドスレッドで実行する。
+
+    ブラウザの接続とは無関係に進み、Streamlitのページはジョブを登録して
+    ストアの状態を読み取るだけでよい。``runner_factory(on_progress)`` は
+    ``pipeline.BatchRunner`` を返す関数。同じDBを別のプロセスやキャッシュを作り直した
+    アプリと共有しても、実行中のジョブは ``runner_id`` の期限つきで持つので二重に実行しない。
+    """
+
+    def __init__(self, store, runner_factory, max_jobs=1, poll_interval=2.0):
+        self.store = store
+        self.runner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.runner_factory = runner_factory
+        self.max_jobs = max_jobs
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        # ストリーミング中の本文や挿絵はプロセス内で保持し、DBには間引いたスナップショットだけを書く
+        self._previews = {}
+        self._preview_saved_at = {}
+
+    def start(self):
+        if self._threads:
+            return self
+        # 前回のプロセスで実行中だったジョブは、期限が切れていれば再開待ちに戻る
+        self.store.requeue_expired()
+        for n in range(self.max_jobs):
+            thread = threading.Thread(target=self._loop, name=f"job-runner-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    def submit(self, articles, reservation_date):
+        job_id = self.store.create_job(articles, reservation_date)
+        self.wake()
+        return job_id
+
+    def submit_stream(self, articles, reservation_date, reader):
+        """``articles`` を別スレッドで読みながら行を登録し、取り込みの完了を待たずにジョブを開始する。
+
+        ``reader`` は ``articles`` の元になった ``ingest.ArticleCsvReader`` で、
+        不正な行・重複行はジョブのログに警告として残す。
+        """
+        job_id = self.store.create_job([], reservation_date, ingesting=True)
+        self.wake()
+        threading.Thread(target=self._ingest, args=(job_id, iter(articles), reader), name=f"job-ingest-{job_id}", daemon=True).start()
+        return job_id
+
+    def _ingest(self, job_id, articles, reader):
+        count = 0
+        reported = 0
+        try:
+            while batch := list(itertools.islice(articles, INGEST_BATCH_SIZE)):
+                self.store.append_rows(job_id, count, batch)
+                count += len(batch)
+                for error in reader.errors[reported:]:
+                    self.store.add_event(job_id, None, "warning", f"CSV {error['line']}行目: {error['message']}")
+                reported = len(reader.errors)
+                self.wake()
+        except Exception as e:
+            logger.exception("ingesting job %s failed", job_id)
+            self.store.add_event(job_id, None, "error", f"CSVの読み込み中にエラーが発生したため、{count}件までを処理します: {e}")
+        finally:
+            for error in reader.errors[reported:]:
+                self.store.add_event(job_id, None, "warning", f"CSV {error['line']}行目: {error['message']}")
+            self.store.add_event(job_id, None, "info", reader.summary())
+            self.store.finish_ingest(job_id)
+            self.wake()
+
+    def preview(self, job_id):
+        """生成中の記事のプレビューを返す。ジョブを別のプロセス（worker.py）が実行していればDBから読む。"""
+        snapshot = self._snapshot(job_id)
+        return snapshot if snapshot is not None else self.store.preview(job_id)
+
+    def _snapshot(self, job_id):
+        with self._lock:
+            preview = self._previews.get(job_id)
+            if not preview:
+                return None
+            snapshot = dict(preview)
+            if preview.get("streaming"):
+                snapshot["article"] = "".join(preview["chunks"])
+            return snapshot
+
+    def _heartbeat(self):
+        while True:
+            try:
+                self.store.renew_leases(self.runner_id)
+                # 停止した別のランナーのジョブは期限が切れた時点で引き継ぐ
+                if self.store.requeue_expired():
+                    self.wake()
+            except Exception:
+                logger.exception("renewing job leases failed")
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    def _loop(self):
+        while True:
+            job = self.store.claim_next_job(self.runner_id)
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            try:
+                if self._run_job(job):
+                    self.store.set_job_status(job["id"], "done", owner=self.runner_id)
+            except Exception as e:
+                logger.exception("job %s failed", job["id"])
+                self.store.add_event(job["id"], None, "error", f"ジョブの実行中にエラーが発生しました: {e}")
+                self.store.set_job_status(job["id"], "failed", owner=self.runner_id)
+
+    def _run_job(self, job):
+        """ジョブの行を処理する。途中で期限が切れて別のランナーに渡った場合は False を返す。"""
+        job_id = job["id"]
+        owned = True
+        reservation_date = datetime.date.fromisoformat(job["reservation_date"])
+        with self.runner_factory(on_progress=lambda event: self._on_event(job_id, event)) as runner:
+            # 取り込み中の行も登録された順に投入する。実行待ちは同時実行数（先行生成の行を含む）の
+            # 2倍までに抑え、大きなCSVでも行データをまとめてメモリに載せない
+            window = (runner.limits.articles + runner.limits.prefetch) * 2
+            # 一括投稿では、投稿の送信を待つだけの行は枠に数えない（数えるとバッチが大きくならない）
+            bulk = runner.publisher is not None
+            in_flight = {}
+            last_index = -1
+            while True:
+                current = self.store.job(job_id)
+                ingesting = current["ingesting"]
+                if owned and current["owner"] != self.runner_id:
+                    # 期限切れで別のランナーに渡ったジョブには新しい行を入れず、処理中の行だけを終える
+                    logger.warning("job %s was taken over by %s; finishing in-flight rows only", job_id, current["owner"])
+                    owned = False
+                busy = runner.working_rows() if bulk else len(in_flight)
+                rows = [
+                    (row["row_index"], {
+                        "main_keyword": row["main_keyword"],
+                        "heading_keywords_list": row["heading_keywords_list"],
+                        "affiliate_html": row["affiliate_html"],
+                        "outline": row["outline"],
+                        "article": row["article"],
+                        "images": row["images"],
+                        "post": row["post"],
+                    })
+                    for row in self.store.pending_rows(job_id, after_index=last_index, limit=window - busy)
+                ] if owned and busy < window else []
+                for (row_index, _), future in zip(rows, runner.submit_rows(rows, reservation_date)):
+                    in_flight[future] = row_index
+                    last_index = row_index
+                if not rows and not in_flight and (not ingesting or not owned):
+                    break
+                if in_flight:
+                    # 一括投稿では行がワーカーを離れた時点で次の行を入れられるので、完了を待ち続けない
+                    timeout = INGEST_POLL_INTERVAL if bulk else self.poll_interval if ingesting else None
+                    done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        row_index = in_flight.pop(future)
+                        try:
+                            future.result()
+                        except Exception as e:
+                            self.store.update_row(job_id, row_index, status="failed", result=f"失敗: {e}")
+                elif not rows:
+                    # 取り込みスレッドが次の行を登録するまで待つ
+                    time.sleep(INGEST_POLL_INTERVAL)
+        with self._lock:
+            self._previews.pop(job_id, None)
+            self._preview_saved_at.pop(job_id, None)
+        self.store.delete_preview(job_id)
+        return owned
+
+    def _on_event(self, job_id, event):
+        row_index = event["index"]
+        if "metric" in event:
+            self.store.add_metric(job_id, row_index, event["metric"])
+            return
+        if "article_chunk" in event:
+            if self._update_preview(job_id, event):
+                self._save_preview(job_id, throttle=True)
+            return
+
+        fields = {"status": event["status"]}
+        if event.get("title"):
+            fields["title"] = event["title"]
+        if "outline" in event:
+            fields["outline"] = event["outline"]
+        if "article" in event:
+            fields["article"] = event["article"]
+        if "post" in event:
+            fields["post"] = event["post"]
+        if "images" in event:
+            fields["images"] = [
+                {"media_id": image_data.get("media_id"), "source_url": image_data.get("source_url")}
+                for image_data in event["images"] if image_data.get("media_id")
+            ]
+        if event["status"] == "done":
+            fields["result"] = "成功"
+        elif event["status"] == "failed":
+            fields["result"] = event.get("message") or "失敗"
+        self.store.update_row(job_id, row_index, **fields)
+
+        if event.get("message") and event["status"] != "failed":
+            self.store.add_event(job_id, row_index, event["level"], event["message"])
+        if self._update_preview(job_id, event):
+            self._save_preview(job_id)
+
+    def _save_preview(self, job_id, throttle=False):
+        # ストリーミング中のチャンクごとには書かず、PREVIEW_SAVE_INTERVAL 秒ごとにまとめて書く
+        now = time.monotonic()
+        with self._lock:
+            if throttle and now - self._preview_saved_at.get(job_id, 0.0) < PREVIEW_SAVE_INTERVAL:
+                return
+            self._preview_saved_at[job_id] = now
+        snapshot = self._snapshot(job_id)
+        if snapshot is not None:
+            self.store.save_preview(job_id, snapshot)
+
+    def _update_preview(self, job_id, event):
+        # プレビューを更新した場合は True を返す
+        index = event["index"]
+        with self._lock:
+            preview = self._previews.setdefault(job_id, {})
+            following = not preview.get("streaming") or preview.get("index") == index
+            if "article_chunk" in event:
+                if not following:
+                    return False
+                if preview.get("index") != index or preview.get("attempt") != event["attempt"] or not preview.get("streaming"):
+                    # 別の記事に切り替わった場合や、応答が途絶えて再試行された場合は最初から表示し直す
+                    preview.clear()
+                    preview.update(index=index, attempt=event["attempt"], streaming=True, chunks=[], images=[])
+                preview["chunks"].append(event["article_chunk"])
+            elif "article" in event and following:
+                preview.clear()
+                preview.update(index=index, article=event["article"], streaming=False, images=[])
+            elif "images" in event and preview.get("index") == index:
+                preview["images"] = event["images"]
+            elif event["status"] == "failed" and preview.get("streaming") and preview.get("index") == index:
+                # 本文の生成中に失敗した場合は、そこまでの内容を残して他の記事の表示に譲る
+                preview.update(article="".join(preview.pop("chunks")), streaming=False)
+            else:
+                return False
+            return True
@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+from collections import defaultdict
+
+# 1レコードの項目。ステージ全体の所要時間は call="stage"、外部呼び出しは call="gemini:outline" などで記録する
+METRIC_FIELDS = (
+    "row", "stage", "call", "model", "seconds", "retries", "prompt_tokens_est",
+    "input_tokens", "output_tokens", "thinking_tokens", "images", "bytes", "cost_usd",
+)
+# prompt_tokens_est は送信前の見積もり（input_tokens はAPIが返した実際の値）
+COUNT_FIELDS = ("retries", "prompt_tokens_est", "input_tokens", "output_tokens", "thinking_tokens", "images", "bytes")
+
+STAGE_COLUMNS = {
+    "generating_outline": "outline_seconds",
+    "generating_article": "article_seconds",
+    "generating_images": "images_seconds",
+    "posting_to_wordpress": "post_seconds",
+}
+
+# USD。Geminiは100万トークンあたり（思考トークンは出力として課金）、画像は1枚あたり（1792x1024 standard）
+DEFAULT_PRICING = {
+    "gemini": {
+        "gemini-2.5-pro": {"input": 1.25, "output": 10.0},
+        "gemini-2.5-flash": {"input": 0.30, "output": 2.50},
+        "gemini-2.5-flash-lite": {"input": 0.10, "output": 0.40},
+    },
+    "images": {
+        "dall-e-3": 0.08,
+    },
+}
+
+
+def pricing_from_secrets(secrets):
+    """``[pricing.gemini."<model>"]`` の input / output と ``[pricing.images]`` で既定の単価を上書きする。"""
+    section = secrets.get("pricing", {})
+    pricing = {
+        "gemini": {model: dict(prices) for model, prices in DEFAULT_PRICING["gemini"].items()},
+        "images": dict(DEFAULT_PRICING["images"]),
+    }
+    for model, prices in section.get("gemini", {}).items():
+        pricing["gemini"].setdefault(model, {}).update({name: float(value) for name, value in prices.items()})
+    for model, price in section.get("images", {}).items():
+        pricing["images"][model] = float(price)
+    return pricing
+
+
+def record_cost(record, pricing=None):
+    pricing = pricing or DEFAULT_PRICING
+    model = record.get("model")
+    if record.get("call", "").startswith("gemini:"):
+        prices = pricing["gemini"].get(model)
+        if not prices:
+            return 0.0
+        output_tokens = record.get("output_tokens", 0) + record.get("thinking_tokens", 0)
+        return (record.get("input_tokens", 0) * prices.get("input", 0) + output_tokens * prices.get("output", 0)) / 1_000_000
+    if record.get("call") == "dalle":
+        return record.get("images", 0) * pricing["images"].get(model, 0.0)
+    return 0.0
+
+
+def with_costs(records, pricing=None):
+    rows = []
+    for record in records:
+        row = {name: record.get(name, 0 if name in COUNT_FIELDS else "") for name in METRIC_FIELDS}
+        row["seconds"] = round(record.get("seconds", 0.0), 3)
+        row["cost_usd"] = round(record_cost(record, pricing), 6)
+        rows.append(row)
+    return rows
+
+
+def percentile(values, q):
+    # 線形補間によるパーセンタイル（q は 0〜100）
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize_articles(records, pricing=None):
+    """記事（行）ごとにステージ別の所要時間・トークン数・画像・推定コストを集計する。"""
+    articles = {}
+    for row in with_costs(records, pricing):
+        article = articles.setdefault(row["row"], {
+            "row": row["row"], "seconds": 0.0, **{column: 0.0 for column in STAGE_COLUMNS.values()},
+            **{name: 0 for name in COUNT_FIELDS if name != "bytes"}, "downloaded_bytes": 0, "uploaded_bytes": 0, "cost_usd": 0.0,
+        })
+        if row["call"] == "stage":
+            article["seconds"] += row["seconds"]
+            if row["stage"] in STAGE_COLUMNS:
+                article[STAGE_COLUMNS[row["stage"]]] += row["seconds"]
+            continue
+        for name in COUNT_FIELDS:
+            if name != "bytes":
+                article[name] += row[name]
+        if row["call"] == "image_download":
+            article["downloaded_bytes"] += row["bytes"]
+        elif row["call"] == "wp_media":
+            article["uploaded_bytes"] += row["bytes"]
+        article["cost_usd"] += row["cost_usd"]
+    return [_rounded(article) for _, article in sorted(articles.items())]
+
+
+def summarize_calls(records, pricing=None):
+    """ステージ・呼び出しの種類ごとに回数・合計/平均/p50/p95/最大時間・トークン数・推定コストを集計する。"""
+    groups = defaultdict(list)
+    for row in with_costs(records, pricing):
+        groups[(row["stage"], row["call"])].append(row)
+    summary = []
+    for (stage, call), rows in groups.items():
+        seconds = [row["seconds"] for row in rows]
+        entry = {
+            "stage": stage,
+            "call": call,
+            "count": len(rows),
+            "total_seconds": sum(seconds),
+            "mean_seconds": sum(seconds) / len(seconds),
+            "p50_seconds": percentile(seconds, 50),
+            "p95_seconds": percentile(seconds, 95),
+            "max_seconds": max(seconds),
+        }
+        entry.update({name: sum(row[name] for row in rows) for name in COUNT_FIELDS})
+        # 大きすぎるプロンプトを見つけやすいよう、最大の見積もりも出す
+        entry["max_prompt_tokens_est"] = max(row["prompt_tokens_est"] for row in rows)
+        entry["cost_usd"] = sum(row["cost_usd"] for row in rows)
+        summary.append(_rounded(entry))
+    return sorted(summary, key=lambda entry: -entry["total_seconds"])
+
+
+def _rounded(entry):
+    return {name: round(value, 6 if name == "cost_usd" else 3) if isinstance(value, float) else value for name, value in entry.items()}
+
+
+def records_to_csv(records, pricing=None):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=METRIC_FIELDS)
+    writer.writeheader()
+    writer.writerows(with_costs(records, pricing))
+    return output.getvalue()
+
+
+def records_to_json(records, pricing=None):
+    return json.dumps(with_costs(records, pricing), ensure_ascii=False, indent=2)
@@ -0,0 +1,709 @@
+import datetime
+import functools
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from article_html import render_article
+from gemini import DEFAULT_REQUEST_TIMEOUT, DEFAULT_STAGE_MODELS, CachedGemini, RateLimitedGemini, shared_registry, stage_models_from_secrets
+from image_store import ImageAssetStore
+from images import IMAGE_MODEL, generate_and_upload_images, generate_image_url
+from prompts import PromptRegistry
+from rate_limit import RetryPolicy, shared_limiters
+from wordpress import MAX_BATCH_SIZE, CategoryIndex, PostPublisher, WordPressClient
+
+# カテゴリー名称のリスト
+CATEGORY_NAMES = ["PC家電", "生活雑貨", "美容", "食品", "飲料", "キッチン", "インテリア", "ファッション", "アパレル", "キッズベビー", "趣味", "ホビー", "ゲーム"]
+DEFAULT_CATEGORY = "どこで買える"
+
+IMAGE_COUNT = 6
+
+STATUS_LABELS = {
+    "queued": "待機中",
+    "generating_outline": "記事構成案を生成中...",
+    "generating_article": "記事を生成中...",
+    "generating_images": "画像を生成中...",
+    "posting_to_wordpress": "WordPressに投稿中...",
+    "done": "完了",
+    "failed": "失敗",
+}
+
+
+@dataclass
+class Settings:
+    gemini_api_key: str
+    openai_api_key: str
+    wp_url: str
+    wp_user: str
+    wp_pass: str
+    # PromptRegistry（dictを渡した場合はここで検証・コンパイルする）
+    prompts: PromptRegistry
+    # "structured": タイトル・スラッグ・カテゴリーを1回のJSON出力で取得 / "separate": 従来の3回呼び出し
+    metadata_mode: str = "structured"
+    gemini_stages: dict = field(default_factory=lambda: dict(DEFAULT_STAGE_MODELS))
+    # 記事本文をストリーミングで生成し、途中経過をプレビューに流す
+    stream_article: bool = True
+    stream_first_chunk_timeout: float = 180.0
+    stream_stall_timeout: float = 30.0
+    stream_retries: int = 1
+    # Gemini APIの読み取りタイムアウト（秒）。停止したストリームのスレッドと接続もこの時間で解放される
+    gemini_request_timeout: float = DEFAULT_REQUEST_TIMEOUT
+    # 通常は空。APIゲートウェイやベンチマーク用のスタンドインに向けるときだけ指定する
+    gemini_base_url: str = None
+    openai_base_url: str = None
+    # 本文をブロックエディター（Gutenberg）のブロックに変換してから投稿する
+    block_editor: bool = False
+    # 記事の作成を /batch/v1 でまとめて送る（対応していないサイトでは1件ずつ送る）
+    bulk_publish: bool = False
+    publish_batch_size: int = MAX_BATCH_SIZE
+    publish_batch_wait: float = 5.0
+
+    def __post_init__(self):
+        if not isinstance(self.prompts, PromptRegistry):
+            self.prompts = PromptRegistry(dict(self.prompts))
+        if "metadata_prompt" not in self.prompts:
+            self.prompts.add("metadata_prompt", default_metadata_template(self.prompts))
+
+    @classmethod
+    def from_secrets(cls, secrets):
+        return cls(
+            gemini_api_key=secrets["gemini"]["api_key"],
+            openai_api_key=secrets["openai"]["api_key"],
+            wp_url=secrets["wordpress"]["url"].rstrip('/'),
+            wp_user=secrets["wordpress"]["username"],
+            wp_pass=secrets["wordpress"]["app_password"],
+            prompts=PromptRegistry.from_secrets(secrets),
+            metadata_mode=secrets["gemini"].get("metadata_mode", "structured"),
+            gemini_stages=stage_models_from_secrets(secrets),
+            stream_article=bool(secrets["gemini"].get("stream_article", True)),
+            stream_first_chunk_timeout=float(secrets["gemini"].get("stream_first_chunk_timeout", 180.0)),
+            stream_stall_timeout=float(secrets["gemini"].get("stream_stall_timeout", 30.0)),
+            stream_retries=int(secrets["gemini"].get("stream_retries", 1)),
+            gemini_request_timeout=float(secrets["gemini"].get("request_timeout", DEFAULT_REQUEST_TIMEOUT)),
+            gemini_base_url=secrets["gemini"].get("base_url") or None,
+            openai_base_url=secrets["openai"].get("base_url") or None,
+            block_editor=bool(secrets["wordpress"].get("block_editor", False)),
+            bulk_publish=bool(secrets["wordpress"].get("bulk_publish", False)),
+            publish_batch_size=int(secrets["wordpress"].get("publish_batch_size", MAX_BATCH_SIZE)),
+            publish_batch_wait=float(secrets["wordpress"].get("publish_batch_wait", 5.0)),
+        )
+
+
+@dataclass
+class ConcurrencyLimits:
+    # 同時に処理する記事数と、外部サービスごとの同時リクエスト数の上限
+    articles: int = 3
+    gemini: int = 3
+    dalle: int = 6
+    wordpress: int = 4
+    # 1記事あたりで同時に生成する挿絵の数
+    images: int = IMAGE_COUNT
+    # 挿絵・投稿中の記事と並行して、後続の何行分まで構成案・本文を先に生成しておくか（0で無効）
+    prefetch: int = 0
+
+    @classmethod
+    def from_secrets(cls, secrets):
+        section = secrets.get("concurrency", {}) if hasattr(secrets, "get") else {}
+        defaults = cls()
+        limits = {
+            name: max(1, int(section.get(name, getattr(defaults, name))))
+            for name in ("articles", "gemini", "dalle", "wordpress", "images")
+        }
+        limits["prefetch"] = max(0, int(section.get("prefetch", defaults.prefetch)))
+        return cls(**limits)
+
+
+@dataclass
+class ArticleResult:
+    index: int
+    main_keyword: str
+    title: str = ""
+    status: str = ""
+    outline: str = ""
+    article: str = ""
+    images: list = field(default_factory=list)
+
+
+def generate_outline(gemini, prompts, main_keyword, heading_keywords_list):
+    midashi_prompt = prompts.render("midashi_prompt", main_keyword=main_keyword, heading_keywords=heading_keywords_list)
+    return gemini.generate("outline", midashi_prompt)
+
+
+def generate_article(gemini, prompts, main_keyword, heading_keywords_list, outline, stream_options=None, on_chunk=None):
+    if not outline: raise ValueError("記事構成案が生成されていません。")
+    article_prompt = prompts.render("article_prompt", main_keyword=main_keyword, heading_keywords=heading_keywords_list, outline=outline)
+    if stream_options is not None:
+        return gemini.generate_stream("article", article_prompt, on_chunk=on_chunk, **stream_options)
+    return gemini.generate("article", article_prompt)
+
+
+def generate_image_prompt(gemini, prompts, main_keyword, heading_keywords_list, article):
+    article_content_for_sashie = f"メインキーワード: {main_keyword}\n見出し用キーワードリスト: {heading_keywords_list}\n記事本文: {article}"
+    sashie_prompt = prompts.render("sashie_prompt", article_content=article_content_for_sashie)
+    return gemini.generate("image_prompt", sashie_prompt).strip()
+
+
+def generate_metadata_separately(gemini, prompts, main_keyword, article_content):
+    title_prompt = prompts.render("title_prompt", main_keyword=main_keyword, article_content=article_content)
+    title = gemini.generate("title", title_prompt).strip()
+
+    # パーマリンク生成
+    permalink_prompt = prompts.render("permalink_prompt", blog_title=title)
+    slug = gemini.generate("slug", permalink_prompt).strip()
+
+    #カテゴリー生成
+    category_prompt = prompts.render("category_prompt", article_content=article_content)
+    category = gemini.generate("category", category_prompt).strip()
+    if category not in CATEGORY_NAMES:
+        category = DEFAULT_CATEGORY
+    return title, slug, category
+
+
+ARTICLE_REFERENCE = "（末尾の「記事本文」を参照）"
+
+
+@functools.cache
+def metadata_schema():
+    from google.genai import types
+
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "title": types.Schema(type=types.Type.STRING),
+            "slug": types.Schema(type=types.Type.STRING),
+            "category": types.Schema(type=types.Type.STRING, enum=CATEGORY_NAMES + [DEFAULT_CATEGORY]),
+        },
+        required=["title", "slug", "category"],
+        property_ordering=["title", "slug", "category"],
+    )
+
+
+def default_metadata_template(prompts):
+    # 3つの指示をまとめた一括生成用のテンプレート。記事本文は末尾に一度だけ含め、各指示からは参照させる
+    title_instructions = prompts.template("title_prompt").partial(article_content=ARTICLE_REFERENCE)
+    permalink_instructions = prompts.template("permalink_prompt").partial(blog_title="（titleで決めたタイトル）")
+    category_instructions = prompts.template("category_prompt").partial(article_content=ARTICLE_REFERENCE)
+    return (
+        "以下の3つの指示に従い、記事のタイトル(title)・パーマリンク用スラッグ(slug)・カテゴリー(category)を"
+        "JSONで1つだけ返してください。\n\n"
+        f"## title の指示\n{title_instructions}\n\n"
+        f"## slug の指示\n{permalink_instructions}\n\n"
+        f"## category の指示\n{category_instructions}\n"
+        f"category は次のいずれかにしてください: {', '.join(CATEGORY_NAMES)}。該当しない場合は「{DEFAULT_CATEGORY}」\n\n"
+        "## 記事本文\n{article_content}"
+    )
+
+
+def build_metadata_prompt(prompts, main_keyword, article_content):
+    return prompts.render("metadata_prompt", main_keyword=main_keyword, article_content=article_content)
+
+
+def parse_metadata(text):
+    data = json.loads(text)
+    title = str(data.get("title", "")).strip()
+    slug = str(data.get("slug", "")).strip()
+    category = str(data.get("category", "")).strip()
+    if not title or not slug:
+        raise ValueError(f"タイトルまたはスラッグが空です: {text[:100]}")
+    if category not in CATEGORY_NAMES:
+        category = DEFAULT_CATEGORY
+    return title, slug, category
+
+
+def generate_metadata_structured(gemini, prompts, main_keyword, article_content):
+    # 構造化出力はGoogle検索ツールと併用できないため、metadataステージではグラウンディングを使わない
+    prompt = build_metadata_prompt(prompts, main_keyword, article_content)
+    text = gemini.generate("metadata", prompt, response_mime_type="application/json", response_schema=metadata_schema())
+    return parse_metadata(text)
+
+
+def generate_metadata(gemini, prompts, main_keyword, article_content, mode="structured", warn=None):
+    if mode == "structured":
+        try:
+            return generate_metadata_structured(gemini, prompts, main_keyword, article_content)
+        except Exception as e:
+            if warn: warn(f"タイトル・スラッグ・カテゴリーの一括生成に失敗したため個別に生成します: {e}")
+    return generate_metadata_separately(gemini, prompts, main_keyword, article_content)
+
+
+def counted_chunks(chunks, fields):
+    # ストリーミングでアップロードしたバイト数を数える
+    for chunk in chunks:
+        fields["bytes"] += len(chunk)
+        yield chunk
+
+
+# アップロード済みの挿絵を再利用する期間。これを過ぎたもの、WordPress側で削除されたものは再アップロードする
+MEDIA_CACHE_TTL = 24 * 3600
+
+
+def chain_future(future, fn):
+    # future の結果に fn を適用した値で完了する Future を返す
+    chained = Future()
+
+    def done(source):
+        try:
+            chained.set_result(fn(source.result()))
+        except BaseException as e:
+            chained.set_exception(e)
+    future.add_done_callback(done)
+    return chained
+
+
+def post_date_for(reservation_date, index):
+    # 投稿日を計算
+    post_date = reservation_date + datetime.timedelta(days=index)
+    return post_date.isoformat() + "T12:00:00"
+
+
+class BatchRunner:
+    """複数記事の生成チェーンを並行して実行する。
+
+    記事単位のワーカープールに加えて、Gemini / DALL-E / WordPress ごとに
+    セマフォで同時リクエスト数を制限するため、CSVの処理時間は行数ではなく
+    各プロバイダーのレート制限に比例する。
+
+    GeminiとDALL-Eの呼び出しはさらに ``rate_limits``（モデルごとのRPM/TPM）で流量を
+    抑え、429や5xxは ``retry_policy`` に従ってその呼び出しだけを再試行する。
+
+    ``limits.prefetch`` が1以上なら、構成案と本文の生成を別のワーカーで行の順に先行させ、
+    挿絵の生成や投稿の待ち時間と重ねる。先行できるのは「処理を始めてまだ終わっていない行」が
+    ``articles + prefetch`` 行になるまでで、Geminiの同時リクエスト数はこれまでどおり
+    ``limits.gemini`` を超えない。
+    """
+
+    def __init__(self, settings, limits=None, on_progress=None, wp_client=None, category_ttl=600.0, cache=None,
+                 image_store=None, rate_limits=None, retry_policy=None):
+        self.settings = settings
+        self.cache = cache
+        self.image_store = image_store or ImageAssetStore()
+        self.gemini_registry = shared_registry(settings.gemini_api_key, settings.gemini_stages, base_url=settings.gemini_base_url,
+                                               timeout=settings.gemini_request_timeout)
+        # 並行するジョブどうしでも同じ枠を数えるため、制限はプロセス全体で共有する
+        self.rate_limiters = shared_limiters(rate_limits)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.limits = limits or ConcurrencyLimits()
+        self.on_progress = on_progress
+        self._slots = {
+            "gemini": threading.BoundedSemaphore(self.limits.gemini),
+            "dalle": threading.BoundedSemaphore(self.limits.dalle),
+            "wordpress": threading.BoundedSemaphore(self.limits.wordpress),
+        }
+        # 再試行は retry_policy でまとめて行うので、SDK側の自動再試行は切っておく
+        import openai
+        self._openai_client = openai.OpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url, max_retries=0)
+        # 呼び出し側から共有クライアントを受け取れば、記事やバッチをまたいで接続を再利用できる
+        self._owns_wp_client = wp_client is None
+        self.wp = wp_client or WordPressClient(settings.wp_url, settings.wp_user, settings.wp_pass, pool_size=self.limits.wordpress)
+        # カテゴリー一覧はバッチごとに一度だけ読み込む
+        self.categories = CategoryIndex(self.wp, ttl=category_ttl)
+        # 一括投稿では、投稿が完了した記事をためて /batch/v1 で送る
+        self.publisher = None
+        self._active = 0
+        self._active_lock = threading.Lock()
+        if settings.bulk_publish:
+            self.publisher = PostPublisher(self.wp, batch_size=settings.publish_batch_size,
+                                           max_wait=settings.publish_batch_wait, slot=self._slot("wordpress"))
+        self._executor = ThreadPoolExecutor(max_workers=self.limits.articles, thread_name_prefix="article")
+        self._prefetch_executor = None
+        if self.limits.prefetch:
+            self._prefetch_capacity = self.limits.articles + self.limits.prefetch
+            self._prefetch_executor = ThreadPoolExecutor(max_workers=self._prefetch_capacity, thread_name_prefix="prefetch")
+            # 先行生成を待つ行。開始は必ず行の順にし、前の行が枠を空けるのを後ろの行が追い越さない
+            self._prefetch_queue = deque()
+            self._prefetch_lock = threading.Lock()
+            self._prefetch_running = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def shutdown(self, wait=True):
+        if self._prefetch_executor is not None and not wait:
+            with self._prefetch_lock:
+                while self._prefetch_queue:
+                    self._prefetch_queue.popleft()[0].cancel()
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+        if self._prefetch_executor is not None:
+            self._prefetch_executor.shutdown(wait=wait, cancel_futures=not wait)
+        if self.publisher is not None:
+            self.publisher.close()
+        if self._owns_wp_client:
+            self.wp.close()
+
+    def submit(self, articles, reservation_date):
+        return self.submit_rows(enumerate(articles), reservation_date)
+
+    def submit_rows(self, rows, reservation_date):
+        # rows は (行番号, 記事データ) の組。行番号は予約投稿日の計算にも使う
+        rows = list(rows)
+        if self.publisher is not None:
+            with self._active_lock:
+                self._active += len(rows)
+        if self._prefetch_executor is None:
+            futures = [
+                self._executor.submit(self.process_article, index, article, reservation_date)
+                for index, article in rows
+            ]
+        else:
+            futures = []
+            for index, article in rows:
+                prepared = Future()
+                with self._prefetch_lock:
+                    self._prefetch_queue.append((prepared, index, article))
+                futures.append(self._executor.submit(self._publish_prefetched, prepared, article, reservation_date))
+            self._start_prefetch()
+        if self.publisher is not None:
+            futures = [self._settle(future) for future in futures]
+        return futures
+
+    def working_rows(self):
+        """投稿済みまたは一括投稿の送信待ちになっていない（ワーカーで処理中・待機中の）行数。"""
+        with self._active_lock:
+            return self._active
+
+    def _settle(self, future):
+        # 一括投稿の記事は、ワーカーが返した投稿の Future が完了した時点で完了にする
+        settled = Future()
+
+        def resolve(source):
+            try:
+                value = source.result()
+            except BaseException as e:
+                settled.set_exception(e)
+                return
+            if isinstance(value, Future):
+                value.add_done_callback(resolve)
+            else:
+                settled.set_result(value)
+
+        def done(source):
+            with self._active_lock:
+                self._active -= 1
+                idle = not self._active
+            if idle:
+                # 処理中の行がなくなったので、ためている投稿を待たずに送る
+                self.publisher.flush()
+            resolve(source)
+        future.add_done_callback(done)
+        return settled
+
+    def run(self, articles, reservation_date):
+        return [future.result() for future in self.submit(articles, reservation_date)]
+
+    def _report(self, index, status, message=None, level="info", **extra):
+        if self.on_progress:
+            self.on_progress({"index": index, "status": status, "message": message, "level": level, **extra})
+
+    def _stream_options(self):
+        settings = self.settings
+        if not settings.stream_article:
+            return None
+        return {
+            "first_chunk_timeout": settings.stream_first_chunk_timeout,
+            "stall_timeout": settings.stream_stall_timeout,
+            "retries": settings.stream_retries,
+        }
+
+    def _slot(self, name):
+        return self._slots[name]
+
+    def _warn(self, index, step, message):
+        self._report(index, step, message, level="warning")
+
+    def _on_retry(self, index, step, provider):
+        def on_retry(attempt, delay, error):
+            self._warn(index, step, f"{provider}の一時的なエラーのため{delay:.1f}秒後に再試行します（{attempt}回目）: {error}")
+        return on_retry
+
+    def _metric(self, index, step, record):
+        # 計測値は metric= 付きのイベントとして流す。ステータスの更新には使わない
+        self._report(index, step, metric={"row": index + 1, "stage": step, **record})
+
+    @contextmanager
+    def _measure(self, index, step, call="stage", **fields):
+        started = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self._metric(index, step, {"call": call, "seconds": time.perf_counter() - started, **fields})
+
+    def _gemini(self, index, step):
+        gemini = RateLimitedGemini(self.gemini_registry, self.rate_limiters, self.retry_policy,
+                                   on_retry=self._on_retry(index, step, "Gemini"),
+                                   on_call=lambda record: self._metric(index, step, record))
+        if self.cache is not None:
+            # 生成済みのステージはキャッシュから返し、最初の未生成ステージから再開する
+            gemini = CachedGemini(gemini, self.cache)
+        return gemini
+
+    def _generate_image_url(self, index, step):
+        limiter = self.rate_limiters.get("openai", IMAGE_MODEL)
+        report_retry = self._on_retry(index, step, "DALL-E")
+
+        def generate_url(dall_e_prompt):
+            with self._measure(index, step, "dalle", model=IMAGE_MODEL, images=0, retries=0) as fields:
+                def on_retry(attempt, delay, error):
+                    fields["retries"] = attempt
+                    report_retry(attempt, delay, error)
+                url = self.retry_policy.call(lambda: generate_image_url(self._openai_client, dall_e_prompt),
+                                             limiter=limiter, on_retry=on_retry)
+                fields["images"] = 1
+            return url
+        return generate_url
+
+    def _fail(self, result, e, step_name):
+        result.title = result.title or result.main_keyword
+        result.status = f"失敗: {step_name}でエラーが発生しました。詳細: {str(e)}"
+        self._report(result.index, "failed", result.status, level="error")
+        return result
+
+    def _start_prefetch(self):
+        with self._prefetch_lock:
+            while self._prefetch_queue and self._prefetch_running < self._prefetch_capacity:
+                prepared, index, article = self._prefetch_queue.popleft()
+                self._prefetch_running += 1
+                self._prefetch_executor.submit(self._prefetch, prepared, index, article)
+
+    def _prefetch(self, prepared, index, article):
+        if not prepared.set_running_or_notify_cancel():
+            return
+        try:
+            prepared.set_result(self.prepare_article(index, article))
+        except BaseException as e:
+            prepared.set_exception(e)
+
+    def _publish_prefetched(self, prepared, article, reservation_date):
+        # 先行して生成された構成案・本文を受け取り、挿絵と投稿を続ける
+        try:
+            result = prepared.result()
+            if result.status:
+                return result
+            return self.publish_article(result, article, reservation_date)
+        finally:
+            if not prepared.cancelled():
+                with self._prefetch_lock:
+                    self._prefetch_running -= 1
+                self._start_prefetch()
+
+    def process_article(self, index, article, reservation_date):
+        """1記事分のステージを順に実行する。
+
+        ``article`` に ``outline`` / ``article`` / ``images`` が含まれていれば、
+        そのステージは完了済みとして飛ばす（中断したジョブの再開用）。
+        """
+        result = self.prepare_article(index, article)
+        if result.status:
+            return result
+        return self.publish_article(result, article, reservation_date)
+
+    def prepare_article(self, index, article):
+        """構成案と本文を生成する。失敗した場合は ``status`` を設定した結果を返す。"""
+        result = ArticleResult(
+            index=index,
+            main_keyword=article["main_keyword"],
+            outline=article.get("outline") or "",
+            article=article.get("article") or "",
+            images=list(article.get("images") or []),
+        )
+
+        if not result.outline:
+            try:
+                with self._measure(index, "generating_outline"):
+                    self._generate_outline(result, article)
+            except Exception as e:
+                return self._fail(result, e, "記事構成案生成")
+
+        if not result.article:
+            try:
+                with self._measure(index, "generating_article"):
+                    self._generate_article(result, article)
+            except Exception as e:
+                return self._fail(result, e, "記事生成")
+        return result
+
+    def publish_article(self, result, article, reservation_date):
+        """挿絵を生成して WordPress に投稿する。"""
+        index = result.index
+        if article.get("images") is None:
+            with self._measure(index, "generating_images"):
+                self._generate_images(result, article)
+
+        try:
+            with self._measure(index, "posting_to_wordpress"):
+                return self._post_to_wordpress(result, article, reservation_date)
+        except Exception as e:
+            return self._fail(result, e, "WordPress投稿")
+        finally:
+            # アップロード済みの挿絵本体は不要なので一時ファイルを消す（サムネイルは残す）
+            self.image_store.discard(result.images)
+
+    def _generate_outline(self, result, article):
+        step = "generating_outline"
+        self._report(result.index, step)
+        with self._slot("gemini"):
+            result.outline = generate_outline(self._gemini(result.index, step), self.settings.prompts, article["main_keyword"], article["heading_keywords_list"])
+        self._report(result.index, step, outline=result.outline)
+
+    def _generate_article(self, result, article):
+        step = "generating_article"
+        index = result.index
+        self._report(index, step)
+        with self._slot("gemini"):
+            result.article = generate_article(
+                self._gemini(index, step), self.settings.prompts, article["main_keyword"], article["heading_keywords_list"], result.outline,
+                stream_options=self._stream_options(),
+                on_chunk=lambda chunk, attempt: self._report(index, step, article_chunk=chunk, attempt=attempt),
+            )
+        self._report(index, step, article=result.article)
+
+    def _generate_images(self, result, article):
+        step = "generating_images"
+        index = result.index
+        main_keyword = article["main_keyword"]
+        self._report(index, step)
+        try:
+            with self._slot("gemini"):
+                dall_e_prompt = generate_image_prompt(self._gemini(index, step), self.settings.prompts, main_keyword, article["heading_keywords_list"], result.article)
+            self._report(index, step, f"DALL-E用挿絵プロンプト: {dall_e_prompt}")
+
+            def upload(i, body, mime_type, extension):
+                # 同じ挿絵を再実行のたびにメディアライブラリへ重複して登録しない
+                media_key = self.cache.make_key("wp_media", self.wp.base_url, dall_e_prompt, i) if self.cache else None
+                cached_media = self.cache.get_json(media_key) if media_key else None
+                if cached_media:
+                    if self._media_reusable(cached_media):
+                        return cached_media["id"], cached_media["source_url"]
+                    # 期限切れか削除済みなので、手元の画像からアップロードし直す
+                    self.cache.delete(media_key)
+                with self._measure(index, step, "wp_media", bytes=0) as fields:
+                    if isinstance(body, bytes):
+                        fields["bytes"] = len(body)
+                    else:
+                        body = counted_chunks(body, fields)
+                    media_id, source_url = self.wp.upload_media(body, f"sashie-{i+1}.{extension}", f"{main_keyword}の挿絵{i+1}", mime_type)
+                if media_key:
+                    self.cache.put_json(media_key, {"id": media_id, "source_url": source_url, "stored_at": time.time()})
+                return media_id, source_url
+
+            result.images = generate_and_upload_images(
+                self._openai_client, dall_e_prompt, IMAGE_COUNT,
+                upload=upload,
+                max_workers=self.limits.images,
+                dalle_slot=self._slot("dalle"),
+                upload_slot=self._slot("wordpress"),
+                warn=lambda message: self._warn(index, step, message),
+                cache=self.cache,
+                store=self.image_store,
+                generate_url=self._generate_image_url(index, step),
+                on_metric=lambda record: self._metric(index, step, record),
+            )
+            if not result.images:
+                self._warn(index, step, "挿絵の生成に失敗しましたが、記事の投稿は続行します。")
+        except Exception as e:
+            self._warn(index, step, f"挿絵生成プロセス全体でエラーが発生しました: {e}。画像なしで投稿を続行します。")
+        self._report(index, step, images=result.images)
+
+    def _media_reusable(self, cached_media):
+        if time.time() - cached_media.get("stored_at", 0) > MEDIA_CACHE_TTL:
+            return False
+        try:
+            return self.wp.media_exists(cached_media["id"])
+        except Exception:
+            return True
+
+    def _post_to_wordpress(self, result, article, reservation_date):
+        step = "posting_to_wordpress"
+        index = result.index
+        main_keyword = article["main_keyword"]
+        self._report(index, step)
+
+        uploaded = [image_data for image_data in result.images if image_data.get('media_id')]
+        uploaded_image_ids = [image_data['media_id'] for image_data in uploaded]
+        image_urls = [image_data['source_url'] for image_data in uploaded]
+
+        article_content = render_article(result.article, image_urls, main_keyword, article.get("affiliate_html", ""),
+                                         blocks=self.settings.block_editor)
+        # 前回の実行で送信まで進んでいた行は同じタイトル・スラッグを使い、作成済みなら送り直さない
+        resumed = article.get("post")
+        if resumed:
+            title, slug, category = resumed["title"], resumed["slug"], resumed["category"]
+        else:
+            with self._slot("gemini"):
+                title, slug, category = generate_metadata(
+                    self._gemini(index, step), self.settings.prompts, main_keyword, article_content,
+                    mode=self.settings.metadata_mode, warn=lambda message: self._warn(index, step, message),
+                )
+            # 送信の前に残しておき、送信後に中断した場合の再開で作成済みの投稿を探せるようにする
+            self._report(index, step, title=title, post={"title": title, "slug": slug, "category": category})
+        result.title = title
+
+        # カテゴリーの処理
+        try:
+            with self._slot("wordpress"), self._measure(index, step, "wp_category"):
+                category_id = self.categories.get_or_create(category)
+        except Exception as e:
+            self._warn(index, step, f"カテゴリー処理中にエラー: {str(e)}")
+            category_id = None
+
+        # 投稿データの作成
+        post = {
+            'title': title,
+            'content': article_content,
+            'status': 'draft',
+            'date': post_date_for(reservation_date, index),
+            'slug': slug,
+            'featured_media': uploaded_image_ids[0] if uploaded_image_ids else 0,
+            'categories': [category_id] if category_id else []
+        }
+        if resumed:
+            with self._slot("wordpress"), self._measure(index, step, "wp_lookup"):
+                post_id = self.wp.find_post(slug, post['date'])
+            if post_id is not None:
+                self._report(index, step, f"前回の実行で作成済みの投稿（ID {post_id}）があるため、送信を省略しました。")
+                return self._finish_post(result, None)
+        if self.publisher is None:
+            with self._slot("wordpress"), self._measure(index, step, "wp_post"):
+                error_message = self.wp.create_post(post)
+            return self._finish_post(result, error_message)
+
+        # 一括投稿では送信を待たずに次の記事へ進み、まとめて送られた時点で結果を確定する
+        started = time.perf_counter()
+
+        def finish(error_message):
+            self._metric(index, step, {"call": "wp_post", "seconds": time.perf_counter() - started})
+            return self._finish_post(result, error_message)
+        return chain_future(self.publisher.submit(post), finish)
+
+    def _finish_post(self, result, error_message):
+        if error_message is None:
+            result.status = "成功"
+            self._report(result.index, "done", title=result.title)
+        else:
+            result.title = result.title or result.main_keyword
+            result.status = f"失敗: {error_message[:100]}"
+            self._report(result.index, "failed", result.status, level="error", title=result.title)
+        return result
+
+
+def runner_factory_from_secrets(secrets, wp_client=None, cache=None):
+    """secrets（st.secrets またはTOMLを読み込んだdict）から BatchRunner を作る関数を返す。"""
+    settings = Settings.from_secrets(secrets)
+    limits = ConcurrencyLimits.from_secrets(secrets)
+    category_ttl = float(secrets["wordpress"].get("category_ttl", 600))
+    image_store = ImageAssetStore.from_secrets(secrets)
+    # [rate_limits.gemini."gemini-2.5-flash"] rpm / tpm, [rate_limits.openai."dall-e-3"] rpm のように指定する
+    rate_limits = secrets.get("rate_limits", {})
+    retry_policy = RetryPolicy.from_secrets(secrets)
+
+    def runner_factory(on_progress=None):
+        return BatchRunner(settings, limits, on_progress=on_progress, wp_client=wp_client, category_ttl=category_ttl, cache=cache,
+                           image_store=image_store, rate_limits=rate_limits, retry_policy=retry_policy)
+
+    return runner_factory
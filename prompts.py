@@ -0,0 +1,154 @@
+"""secretsの ``[prompts]`` テンプレートを起動時に一度だけ解析して保持する。
+
+各テンプレートは「固定文字列」と「プレースホルダー名」の並びに分解しておき、
+描画時はそれを1回つなぐだけにする。使えないプレースホルダーやテンプレート名の
+書き間違いは、最初の記事を処理する前に ``PromptConfigError`` で知らせる。
+"""
+import re
+
+from rate_limit import estimate_tokens
+
+# プレースホルダー名と、テンプレート内での表記
+PLACEHOLDERS = {
+    "main_keyword": "｛チャットで入力した▼メインキーワード｝",
+    "heading_keywords": "｛チャットで入力した▼見出し用キーワードリスト｝",
+    "outline": "｛チャットで入力した▼記事構成案｝",
+    "article_content": "{article_content}",
+    "blog_title": "{blog_title}",
+}
+PLACEHOLDER_NAMES = {token: name for name, token in PLACEHOLDERS.items()}
+
+# テンプレートごとに使えるプレースホルダー
+TEMPLATE_PLACEHOLDERS = {
+    "midashi_prompt": ("main_keyword", "heading_keywords"),
+    "article_prompt": ("main_keyword", "heading_keywords", "outline"),
+    "sashie_prompt": ("article_content",),
+    "title_prompt": ("main_keyword", "article_content"),
+    "permalink_prompt": ("blog_title",),
+    "category_prompt": ("article_content",),
+    "metadata_prompt": ("main_keyword", "article_content"),
+}
+OPTIONAL_TEMPLATES = {"metadata_prompt"}
+# 以前から使われている綴りも受け付ける
+TEMPLATE_ALIASES = {"sashie_pronpt": "sashie_prompt"}
+
+TOKEN_PATTERN = re.compile("|".join(re.escape(token) for token in PLACEHOLDERS.values()))
+# 書き間違いの検出用。{アフィリエイト} のように本文に残す指示は対象外
+SUSPICIOUS_PATTERN = re.compile(r"｛チャットで入力した▼[^｝]*｝|\{[a-z_]+\}")
+
+
+class PromptConfigError(ValueError):
+    pass
+
+
+class PromptTooLarge(ValueError):
+    pass
+
+
+class RenderedPrompt(str):
+    """描画済みのプロンプト。``estimated_tokens`` に描画時のトークン数の見積もりを持つ。"""
+
+    __slots__ = ("estimated_tokens",)
+
+
+class PlaceholderRef:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class CompiledPrompt:
+    """固定文字列とプレースホルダー名が交互に並んだテンプレート。"""
+
+    def __init__(self, name, text):
+        self.name = name
+        self.segments = []
+        position = 0
+        for match in TOKEN_PATTERN.finditer(text):
+            if match.start() > position:
+                self.segments.append(text[position:match.start()])
+            self.segments.append(PlaceholderRef(PLACEHOLDER_NAMES[match.group(0)]))
+            position = match.end()
+        if position < len(text):
+            self.segments.append(text[position:])
+        self.placeholders = {segment.name for segment in self.segments if isinstance(segment, PlaceholderRef)}
+        self.static_tokens = sum(estimate_tokens(segment) for segment in self.segments if isinstance(segment, str))
+
+    def render(self, **values):
+        missing = self.placeholders - values.keys()
+        if missing:
+            raise KeyError(f"{self.name} の描画に必要な値がありません: {', '.join(sorted(missing))}")
+        return "".join(values[segment.name] if isinstance(segment, PlaceholderRef) else segment for segment in self.segments)
+
+    def partial(self, **values):
+        # 一部のプレースホルダーだけを埋めたテンプレート文字列を返す
+        return "".join(
+            values[segment.name] if isinstance(segment, PlaceholderRef) and segment.name in values
+            else PLACEHOLDERS[segment.name] if isinstance(segment, PlaceholderRef) else segment
+            for segment in self.segments
+        )
+
+    def estimate_tokens(self, **values):
+        return self.static_tokens + sum(
+            estimate_tokens(values[segment.name]) for segment in self.segments if isinstance(segment, PlaceholderRef)
+        )
+
+
+class PromptRegistry:
+    """検証済みのテンプレートを名前で引いて描画する。
+
+    ``render`` は見積もりトークン数つきの ``RenderedPrompt`` を返す。``max_tokens`` を超える
+    見積もりのプロンプトはAPIに送る前に ``PromptTooLarge`` にする。
+    """
+
+    def __init__(self, templates, max_tokens=None):
+        self.max_tokens = max_tokens
+        self._templates = {}
+        problems = []
+        for key, text in templates.items():
+            name = TEMPLATE_ALIASES.get(key, key)
+            if name not in TEMPLATE_PLACEHOLDERS:
+                problems.append(f"未知のテンプレート名です: {key}（使えるのは {', '.join(TEMPLATE_PLACEHOLDERS)}）")
+                continue
+            if name in self._templates and key in TEMPLATE_ALIASES:
+                continue
+            compiled = CompiledPrompt(name, str(text))
+            allowed = {PLACEHOLDERS[placeholder] for placeholder in TEMPLATE_PLACEHOLDERS[name]}
+            for token in sorted(set(SUSPICIOUS_PATTERN.findall(str(text))) - allowed):
+                problems.append(f"{key} では使えないプレースホルダーです: {token}")
+            self._templates[name] = compiled
+        for name in TEMPLATE_PLACEHOLDERS:
+            if name not in self._templates and name not in OPTIONAL_TEMPLATES:
+                problems.append(f"テンプレートがありません: {name}")
+        if problems:
+            raise PromptConfigError("プロンプトの設定に問題があります:\n" + "\n".join(f"- {problem}" for problem in problems))
+
+    @classmethod
+    def from_secrets(cls, secrets):
+        max_tokens = secrets.get("gemini", {}).get("max_prompt_tokens")
+        return cls(dict(secrets["prompts"]), max_tokens=int(max_tokens) if max_tokens else None)
+
+    def __contains__(self, name):
+        return name in self._templates
+
+    def template(self, name):
+        return self._templates[name]
+
+    def add(self, name, text):
+        self._templates[name] = CompiledPrompt(name, text)
+
+    def render(self, name, **values):
+        template = self._templates[name]
+        text = RenderedPrompt(template.render(**values))
+        text.estimated_tokens = template.estimate_tokens(**values)
+        if self.max_tokens and text.estimated_tokens > self.max_tokens:
+            raise PromptTooLarge(f"{name} のプロンプトが大きすぎます（約{text.estimated_tokens:,}トークン、上限{self.max_tokens:,}）。")
+        return text
+
+    def report(self):
+        """テンプレートごとのプレースホルダーと、固定部分のトークン数の見積もり。"""
+        return [
+            {"name": name, "placeholders": ", ".join(sorted(template.placeholders)), "static_tokens": template.static_tokens}
+            for name, template in self._templates.items()
+        ]
@@ -0,0 +1,182 @@
+import functools
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+import requests
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+@functools.cache
+def transient_errors():
+    # SDKの読み込みは重いので、最初にエラーを判定するときまで遅らせる
+    import httpx
+    import openai
+    return (
+        ConnectionError,
+        TimeoutError,
+        requests.ConnectionError,
+        requests.Timeout,
+        httpx.TransportError,
+        openai.APIConnectionError,
+    )
+
+
+def estimate_tokens(text):
+    # 英数字は約4文字で1トークン、日本語などはほぼ1文字1トークンとして概算する
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+def error_status(e):
+    for value in (getattr(e, "status_code", None), getattr(e, "code", None)):
+        if isinstance(value, int):
+            return value
+    response = getattr(e, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def retry_after_seconds(e):
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def is_retryable(e):
+    return isinstance(e, transient_errors()) or error_status(e) in RETRYABLE_STATUSES
+
+
+class TokenBucket:
+    """1分あたり ``per_minute`` 単位を補充するトークンバケット。
+
+    ``reserve`` は先に枠を確保して待つべき秒数を返すので、待機はロックの外で行える。
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class ProviderLimiter:
+    """プロバイダー・モデルごとのRPM/TPM制限。429を受けたら全呼び出しをまとめて待たせる。"""
+
+    def __init__(self, rpm=None, tpm=None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        waits = [0.0]
+        if self.requests:
+            waits.append(self.requests.reserve(1))
+        if self.tokens and tokens:
+            waits.append(self.tokens.reserve(tokens))
+        with self._lock:
+            waits.append(self._blocked_until - time.monotonic())
+        delay = max(waits)
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+class RateLimiterRegistry:
+    def __init__(self, limits=None):
+        # limits: {"gemini": {"gemini-2.5-flash": {"rpm": 1000, "tpm": 1000000}}, "openai": {"dall-e-3": {"rpm": 5}}}
+        self.limits = limits or {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider, model):
+        with self._lock:
+            key = (provider, model)
+            if key not in self._limiters:
+                config = self.limits.get(provider, {}).get(model, {})
+                self._limiters[key] = ProviderLimiter(rpm=config.get("rpm"), tpm=config.get("tpm"))
+            return self._limiters[key]
+
+
+_shared_registries = {}
+_shared_lock = threading.Lock()
+
+
+def shared_limiters(limits=None):
+    # 同じAPIキーの枠を共有する並行ジョブどうしで同じ制限を使う
+    limits = {provider: {model: dict(config) for model, config in models.items()} for provider, models in (limits or {}).items()}
+    key = json.dumps(limits, sort_keys=True)
+    with _shared_lock:
+        if key not in _shared_registries:
+            _shared_registries[key] = RateLimiterRegistry(limits)
+        return _shared_registries[key]
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 5
+    base_delay: float = 2.0
+    max_delay: float = 60.0
+
+    @classmethod
+    def from_secrets(cls, secrets):
+        section = secrets.get("retry", {})
+        defaults = cls()
+        return cls(
+            max_attempts=max(1, int(section.get("max_attempts", defaults.max_attempts))),
+            base_delay=float(section.get("base_delay", defaults.base_delay)),
+            max_delay=float(section.get("max_delay", defaults.max_delay)),
+        )
+
+    def delay(self, attempt):
+        # 指数バックオフ + ジッター（上限の半分は必ず待つ）
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def call(self, fn, limiter=None, tokens=0, on_retry=None):
+        """``fn`` を呼び、一時的なエラーなら待ってから再試行する。
+
+        ``Retry-After`` があればその秒数を優先し、429の場合は ``limiter`` 全体を止めて
+        他のスレッドも同じだけ待たせる。``on_retry(attempt, delay, error)`` で再試行を通知する。
+        """
+        for attempt in range(self.max_attempts):
+            if limiter:
+                limiter.acquire(tokens)
+            try:
+                return fn()
+            except Exception as e:
+                if attempt + 1 >= self.max_attempts or not is_retryable(e):
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = self.delay(attempt)
+                if limiter and error_status(e) == 429:
+                    limiter.pause(delay)
+                if on_retry:
+                    on_retry(attempt + 1, delay, e)
+                time.sleep(delay)
@@ -0,0 +1,411 @@
+import base64
+import contextlib
+import html
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# 作成系のPOSTは、サーバーが処理していないと分かる場合（接続自体ができなかった場合と429/503）だけ再送する。
+# 読み取りタイムアウトや送信後の切断、502/504の後には作成済みのことがあり、再送すると重複する
+RETRY_UNSENT = "unsent"
+UNSENT_RETRY_STATUSES = {429, 503}
+REST_NAMESPACE = "/wp/v2"
+# /batch/v1 が1回に受け付けるリクエスト数（WordPressの既定値）
+MAX_BATCH_SIZE = 25
+# /batch/v1 がないサイト（WordPress 5.6未満や、ルートを無効にしている場合）の応答
+BATCH_UNSUPPORTED_STATUSES = {404, 405, 501}
+# /batch/v1 はあっても、ルート側が一括処理を許可していない場合のリクエストごとのエラー
+BATCH_NOT_ALLOWED_CODE = "rest_batch_not_allowed"
+
+
+def connection_never_made(error):
+    """``error`` が接続の確立前（名前解決・TCP接続）の失敗で、リクエストが届いていないなら True。
+
+    requests は送信後の切断（urllib3 の ``ProtocolError`` など）も ``ConnectionError`` にするため、
+    例外の型だけでは区別できない。原因をたどって ``NewConnectionError``
+    （``NameResolutionError`` を含む）があるかで判断する。
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    seen = set()
+    pending = [error]
+    while pending:
+        current = pending.pop()
+        if current is None or id(current) in seen:
+            continue
+        seen.add(id(current))
+        if isinstance(current, NewConnectionError):
+            return True
+        if isinstance(current, BaseException):
+            pending.extend(arg for arg in current.args if isinstance(arg, BaseException))
+            pending.extend((getattr(current, "reason", None), current.__cause__, current.__context__))
+    return False
+
+
+def retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class WordPressClient:
+    """WordPress REST APIクライアント。
+
+    1つのSessionをコネクションプールとKeep-Aliveで使い回し、認証ヘッダーも一度だけ
+    組み立てる。429/5xxと接続エラーは指数バックオフで再試行する（``Retry-After``
+    があればそれに従う）。
+    """
+
+    def __init__(self, url, username, app_password, timeout=60.0, connect_timeout=10.0,
+                 max_retries=3, backoff_factor=0.5, pool_size=10):
+        self.base_url = url.rstrip('/')
+        self.timeout = (connect_timeout, timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        credentials = f"{username}:{app_password}"
+        token = base64.b64encode(credentials.encode())
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': f'Basic {token.decode("utf-8")}'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_secrets(cls, secrets):
+        section = secrets["wordpress"]
+        return cls(
+            section["url"],
+            section["username"],
+            section["app_password"],
+            timeout=float(section.get("timeout", 60.0)),
+            connect_timeout=float(section.get("connect_timeout", 10.0)),
+            max_retries=int(section.get("max_retries", 3)),
+            backoff_factor=float(section.get("backoff_factor", 0.5)),
+            pool_size=int(section.get("pool_size", 10)),
+        )
+
+    def close(self):
+        self.session.close()
+
+    def _backoff(self, attempt):
+        delay = self.backoff_factor * (2 ** attempt)
+        return delay + random.uniform(0, delay / 2)
+
+    def request(self, method, path, retry=True, **kwargs):
+        # 本文をストリームで送る場合は再送できないため retry=False で呼ぶ。
+        # 投稿やメディアなどを作成するPOSTは retry=RETRY_UNSENT で、接続できなかった場合と429/503だけを再送する
+        kwargs.setdefault("timeout", self.timeout)
+        url = path if path.startswith(("http://", "https://")) else f"{self.base_url}/{path.lstrip('/')}"
+        attempts = self.max_retries + 1 if retry else 1
+        retry_statuses = UNSENT_RETRY_STATUSES if retry == RETRY_UNSENT else RETRY_STATUSES
+        for attempt in range(attempts):
+            last_attempt = attempt + 1 >= attempts
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt or (retry == RETRY_UNSENT and not connection_never_made(e)):
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            if response.status_code in retry_statuses and not last_attempt:
+                delay = retry_after_seconds(response)
+                response.close()
+                time.sleep(self._backoff(attempt) if delay is None else delay)
+                continue
+            return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def upload_media(self, chunks, filename, alt_text, mime_type="image/png"):
+        # multipartではなく本文に画像を直接流し込むことで、ダウンロードしながらアップロードできる
+        headers = {
+            'Content-Type': mime_type,
+            'Content-Disposition': f'attachment; filename="{filename}"',
+        }
+        replayable = isinstance(chunks, (bytes, bytearray))
+        upload_response = self.post("media", headers=headers, params={'alt_text': alt_text}, data=chunks,
+                                    retry=RETRY_UNSENT if replayable else False)
+        if not upload_response.ok:
+            raise Exception(upload_response.text)
+        media_data = upload_response.json()
+        return media_data['id'], media_data['source_url']
+
+    def media_exists(self, media_id):
+        # 削除済み（404/410）のときだけ False。判断できない応答では存在するものとみなす
+        response = self.get(f"media/{media_id}", params={'_fields': 'id'})
+        return response.status_code not in (404, 410)
+
+    def find_post(self, slug, date=None):
+        # slug（と投稿日時）が一致する下書き・予約投稿を探し、見つかればIDを返す
+        response = self.get("posts", params={'slug': slug, 'status': 'draft,future', 'context': 'edit', '_fields': 'id,date'})
+        if not response.ok:
+            raise Exception(response.text)
+        for post in response.json():
+            if date is None or (post.get("date") or "")[:19] == date[:19]:
+                return post["id"]
+        return None
+
+    def create_post(self, post):
+        # 成功時は None、失敗時はエラーメッセージを返す
+        response = self.post("posts", json=post, retry=RETRY_UNSENT)
+        if response.ok:
+            return None
+        error_message = response.text
+        if "text/html" in response.headers.get("Content-Type", ""): error_message = "WordPressサーバーから予期せぬHTML応答 (404等)"
+        return error_message
+
+    def batch(self, requests, validation="normal"):
+        """``/batch/v1`` に複数のリクエストをまとめて送り、リクエストごとの応答を返す。
+
+        ``requests`` の ``path`` は ``/posts`` のように ``wp/v2`` からの相対パスで渡す。
+        応答は ``{"status": ..., "body": ...}`` の並びで、他のリクエストの検証エラーのために
+        実行されなかったものは None になる。サイトが対応していなければ None を返す。
+        """
+        if not self.base_url.endswith(REST_NAMESPACE):
+            return None
+        root = self.base_url[:-len(REST_NAMESPACE)]
+        payload = {
+            "validation": validation,
+            "requests": [{**request, "path": REST_NAMESPACE + request["path"]} for request in requests],
+        }
+        # 読み取りタイムアウトや5xxの後には一部が作成済みのことがあるので、まとめて再送はしない
+        response = self.post(f"{root}/batch/v1", json=payload, retry=RETRY_UNSENT)
+        if response.status_code in BATCH_UNSUPPORTED_STATUSES:
+            return None
+        if not response.ok:
+            raise Exception(response.text)
+        return response.json().get("responses", [])
+
+
+def _reconcile_fields(post, created):
+    # アイキャッチ画像と予約日時が指定どおりに保存されたかを確かめ、違う項目だけを返す
+    fields = {}
+    if post.get("featured_media") and created.get("featured_media") != post["featured_media"]:
+        fields["featured_media"] = post["featured_media"]
+    if post.get("date") and (created.get("date") or "")[:19] != post["date"][:19]:
+        fields["date"] = post["date"]
+    return fields
+
+
+class PostPublisher:
+    """複数記事の投稿を ``/batch/v1`` にまとめて送る。
+
+    ``submit`` は、``WordPressClient.create_post`` と同じく成功時は None、失敗時は
+    エラーメッセージになる Future を返す。最初の投稿から ``max_wait`` 秒経つか
+    ``batch_size`` 件たまるか ``flush`` が呼ばれた時点でまとめて送信し、作成後の
+    ``featured_media`` と ``date`` の食い違いも1回の一括更新で直す。サイトが
+    ``/batch/v1`` に対応していないか ``/posts`` の一括処理を許可していなければ、以後はコネクションプールを使って1件ずつ並行に送る。
+    """
+
+    def __init__(self, client, batch_size=MAX_BATCH_SIZE, max_wait=5.0, slot=None):
+        self.client = client
+        self.batch_size = min(max(1, batch_size), MAX_BATCH_SIZE)
+        self.max_wait = max_wait
+        self.slot = slot or contextlib.nullcontext()
+        # None: 未確認 / True: 対応 / False: 非対応
+        self.supported = None
+        self._pending = []
+        self._flush = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="wp-batch", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        # 待機中の投稿を送ってからスレッドを止める
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def flush(self):
+        # これ以上すぐには投稿が来ないと分かっているときに、待たずに送らせる
+        with self._condition:
+            if self._pending:
+                self._flush = True
+                self._condition.notify()
+
+    def submit(self, post):
+        future = Future()
+        if self.supported is False:
+            with self.slot:
+                future.set_result(self.client.create_post(post))
+            return future
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("PostPublisher is closed")
+            self._pending.append((post, future))
+            self._condition.notify()
+        return future
+
+    def create_post(self, post):
+        return self.submit(post).result()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.batch_size and not self._closed and not self._flush:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+                self._flush = bool(self._pending) and self._flush
+            posts = [post for post, _ in batch]
+            try:
+                results = self._publish(posts)
+            except Exception as e:
+                # 送信済みかどうか分からないので再送せず、失敗として報告する（重複投稿を避ける）
+                results = [f"一括投稿の結果を確認できませんでした（WordPress側で作成済みの可能性があります）: {e}"] * len(posts)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _publish_each(self, posts):
+        def publish(post):
+            try:
+                with self.slot:
+                    return self.client.create_post(post)
+            except Exception as e:
+                return str(e)
+        with ThreadPoolExecutor(max_workers=len(posts), thread_name_prefix="wp-post") as pool:
+            return list(pool.map(publish, posts))
+
+    def _publish(self, posts):
+        if self.supported is False:
+            return self._publish_each(posts)
+        with self.slot:
+            responses = self.client.batch([{"method": "POST", "path": "/posts", "body": post} for post in posts])
+        if responses is None:
+            logger.info("WordPress does not support /batch/v1; publishing posts one by one")
+            self.supported = False
+            return self._publish_each(posts)
+        self.supported = True
+        if len(responses) != len(posts):
+            raise Exception(f"/batch/v1 の応答数が一致しません（{len(responses)}件/{len(posts)}件）")
+
+        results = [None] * len(posts)
+        skipped, updates = [], []
+        for i, (post, response) in enumerate(zip(posts, responses)):
+            if response is None:
+                # 同じバッチの別の投稿が検証で弾かれたため実行されなかった
+                skipped.append(i)
+            elif (response.get("body") or {}).get("code") == BATCH_NOT_ALLOWED_CODE:
+                # /posts が一括処理を許可していないので作成されていない。以後は1件ずつ送る
+                if self.supported:
+                    logger.info("WordPress does not allow /posts in /batch/v1; publishing posts one by one")
+                self.supported = False
+                skipped.append(i)
+            elif 200 <= response.get("status", 0) < 300:
+                fields = _reconcile_fields(post, response.get("body") or {})
+                if fields:
+                    updates.append({"method": "POST", "path": f"/posts/{response['body']['id']}", "body": fields})
+            else:
+                results[i] = json.dumps(response.get("body"), ensure_ascii=False)
+        if skipped:
+            for i, result in zip(skipped, self._publish_each([posts[i] for i in skipped])):
+                results[i] = result
+        if updates:
+            self._reconcile(updates)
+        return results
+
+    def _reconcile(self, updates):
+        try:
+            with self.slot:
+                responses = self.client.batch(updates) or []
+        except Exception as e:
+            responses = []
+            logger.warning("failed to update featured_media/date of %d posts: %s", len(updates), e)
+        for update, response in zip(updates, responses):
+            if response is None or not 200 <= response.get("status", 0) < 300:
+                logger.warning("failed to update %s: %s", update["path"], response and response.get("body"))
+
+
+class CategoryIndex:
+    """カテゴリー名（大文字小文字を区別しない）からIDを引く索引。
+
+    最初の参照時に ``/categories`` を全ページ読み込み、``ttl`` 秒経過するまでは
+    再取得しない。新規作成したカテゴリーはその場で索引に追加する。
+    """
+
+    def __init__(self, client, ttl=600.0, per_page=100):
+        self.client = client
+        self.ttl = ttl
+        self.per_page = per_page
+        self._ids = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name):
+        # REST APIはカテゴリー名をHTMLエスケープして返す
+        return html.unescape(name).strip().casefold()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _expired(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def _load(self):
+        ids = {}
+        page, total_pages = 1, 1
+        while page <= total_pages:
+            categories_response = self.client.get("categories", params={'per_page': self.per_page, 'page': page, '_fields': 'id,name'})
+            if not categories_response.ok:
+                raise Exception(f"カテゴリー情報の取得に失敗: {categories_response.text}")
+            for cat in categories_response.json():
+                ids.setdefault(self._key(cat['name']), cat['id'])
+            total_pages = int(categories_response.headers.get("X-WP-TotalPages", 1) or 1)
+            page += 1
+        self._ids = ids
+        self._loaded_at = time.monotonic()
+
+    def get_or_create(self, category):
+        key = self._key(category)
+        with self._lock:
+            if self._expired():
+                self._load()
+            if key in self._ids:
+                return self._ids[key]
+
+            # カテゴリーが存在しない場合は新規作成
+            new_category = {
+                'name': category,
+                'description': f'「{category}」に関する記事一覧'
+            }
+            create_response = self.client.post("categories", json=new_category, retry=RETRY_UNSENT)
+            if create_response.ok:
+                category_id = create_response.json()['id']
+            else:
+                # 索引の読み込み後に他から作成されていた場合
+                error = create_response.json() if "json" in create_response.headers.get("Content-Type", "") else {}
+                category_id = (error.get('data') or {}).get('term_id') if error.get('code') == 'term_exists' else None
+                if category_id is None:
+                    raise Exception(f"カテゴリーの作成に失敗: {create_response.text}")
+            self._ids[key] = category_id
+            return category_id
@@ -0,0 +1,48 @@
+"""Streamlitのページを開かずにジョブキューを処理するワーカー。
+
+アプリと同じsecrets.tomlとジョブDBを使い、起動時に中断されていたジョブを再開してから
+キューに登録されたジョブを順に実行する。アプリ側では ``[jobs] external_worker = true``
+を設定し、ジョブの実行をこのワーカーだけに任せる。
+
+    python worker.py --secrets .streamlit/secrets.toml
+"""
+import argparse
+import logging
+import sys
+import threading
+
+from cache import ContentCache
+from cli import load_secrets
+from jobs import job_runner_from_secrets
+from pipeline import runner_factory_from_secrets
+from wordpress import WordPressClient
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml", help="secrets.tomlのパス")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # APIクライアントのリクエストごとのログは多すぎるので抑える
+    for name in ("httpx", "google_genai"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    secrets = load_secrets(args.secrets)
+    wp_client = WordPressClient.from_secrets(secrets)
+    runner_factory = runner_factory_from_secrets(secrets, wp_client=wp_client, cache=ContentCache.from_secrets(secrets))
+    job_runner = job_runner_from_secrets(secrets, runner_factory).start()
+    logging.getLogger(__name__).info("job worker started with %d job thread(s)", job_runner.max_jobs)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        wp_client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())